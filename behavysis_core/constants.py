@@ -61,3 +61,5 @@ STR_DIV = "".ljust(50, "-")
 
 PLOT_STYLE = "whitegrid"
 PLOT_DPI = 75
+# Switch to disable all plotting (e.g. for headless production runs)
+PLOTS_ENABLED = os.environ.get("BEHAVYSIS_PLOTS", "1") != "0"
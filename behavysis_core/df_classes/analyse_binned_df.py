@@ -19,17 +19,20 @@ str
 from __future__ import annotations
 
 import os
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
-from typing import Callable
+from typing import Callable, Iterable
 
 import numpy as np
 import pandas as pd
-import seaborn as sns
 
 from behavysis_core.df_classes.analyse_df import AnalyseDf
 from behavysis_core.df_classes.bouts_df import BoutsDf
-from behavysis_core.df_classes.df_mixin import DFMixin
+from behavysis_core.df_classes.df_mixin import DFMixin, DFWriter
 from behavysis_core.mixins.misc_mixin import MiscMixin
+from behavysis_core.mixins.plot_mixin import PlotKinds, PlotMixin, PlotQueue
+from behavysis_core.pydantic_models.plot_spec import PlotSpec
 
 FBF = "fbf"
 SUMMARY = "summary"
@@ -79,40 +82,253 @@ class AnalyseBinnedDf(DFMixin):
         str
             The outcome string.
         """
-        # Getting summary stats for each individual
-        summary_df_ls = np.zeros(analysis_df.shape[1], dtype="object")
-        for i, col in enumerate(analysis_df.columns):
-            # Getting column vector of individual-measure
-            vect = analysis_df[col]
-            # Handling edge case where columns are empty
-            vect = np.array([0]) if vect.shape[0] == 0 else vect
-            # Setting columns to type float
-            vect = vect.astype(np.float64)
-            # Aggregating stats
-            summary_df_ls[i] = (
-                pd.Series(
-                    {
-                        "mean": np.nanmean(vect),
-                        "std": np.nanstd(vect),
-                        "min": np.nanmin(vect),
-                        "Q1": np.nanquantile(vect, q=0.25),
-                        "median": np.nanmedian(vect),
-                        "Q3": np.nanquantile(vect, q=0.75),
-                        "max": np.nanmax(vect),
-                    },
-                    name=col,
-                )
-                .to_frame()
-                .T
-            )
-        # Concatenating summary_df_ls
-        summary_df = pd.concat(summary_df_ls, axis=0)
-        # Setting the index and columns
-        summary_df.index = analysis_df.columns
+        # Getting (individual-measure, frames) array (rows are contiguous columns)
+        arr = np.ascontiguousarray(analysis_df.to_numpy(dtype=np.float64).T)
+        # Handling edge case where columns are empty
+        arr = np.zeros((arr.shape[0], 1)) if arr.shape[1] == 0 else arr
+        # Aggregating stats for all columns at once
+        summary_df = pd.DataFrame(
+            {
+                "mean": np.nanmean(arr, axis=1),
+                "std": np.nanstd(arr, axis=1),
+                **cls.nanquantiles(arr),
+            },
+            index=analysis_df.columns,
+        )
         summary_df.columns.name = cls.CN.AGGS.value
         # Returning summary_df
         return summary_df
 
+    @staticmethod
+    def nanquantiles(
+        arr: np.ndarray,
+        bounds: None | np.ndarray = None,
+        order: None | np.ndarray = None,
+    ) -> dict[str, np.ndarray]:
+        """
+        Returns the min, Q1, median, Q3, and max of each row of the 2D `arr`
+        (ignoring NaNs), from one sort of the array.
+        Values are the same as `np.nanmin`, `np.nanquantile` (linear method),
+        `np.nanmedian`, and `np.nanmax` for each row (NaN for all-NaN rows).
+
+        If `bounds` is given, returns them for each segment (i.e. columns
+        `bounds[k]:bounds[k + 1]`) of each row, as `(rows, segments)` arrays.
+        Columns outside `bounds[0]:bounds[-1]` are ignored.
+        If `order` (i.e. each row's `np.argsort`) is given, the rows are sorted within
+        the segments by a stable (radix) sort of the segment ids in that order,
+        rather than by a full sort.
+        """
+        single = bounds is None
+        bounds = np.array([0, arr.shape[1]]) if single else np.asarray(bounds)
+        lengths = np.diff(bounds)
+        # Handling edge case where there are no values
+        if arr.shape[1] == 0:
+            nans = np.full((arr.shape[0], lengths.shape[0]), np.nan)
+            nans = nans[:, 0] if single else nans
+            return {k: nans.copy() for k in ("min", "Q1", "median", "Q3", "max")}
+        # Sorting each row within each segment (NaNs are sorted to the segment end)
+        if single and order is None:
+            arr = np.sort(arr, axis=1)
+        else:
+            # Getting the segment id of each column (outside columns are sorted last)
+            n_segs = lengths.shape[0]
+            seg_ids = np.full(arr.shape[1], n_segs, dtype=np.min_scalar_type(n_segs))
+            seg_ids[bounds[0] : bounds[-1]] = np.repeat(np.arange(n_segs), lengths)
+            if order is None:
+                seg_ids = np.broadcast_to(seg_ids, arr.shape)
+                order = np.lexsort((arr, seg_ids), axis=1)
+            else:
+                seg_order = np.argsort(seg_ids[order], axis=1, kind="stable")
+                order = np.take_along_axis(order, seg_order, axis=1)
+            arr = np.take_along_axis(arr, order, axis=1)
+            bounds = bounds - bounds[0]
+        # Getting the number of non-NaN values in each row segment
+        if single:
+            n = np.count_nonzero(~np.isnan(arr), axis=1)[:, None]
+        else:
+            # Cumulative count in the smallest int dtype that fits the row length
+            dtype = np.min_scalar_type(-arr.shape[1] - 1)
+            cumsum = np.zeros((arr.shape[0], arr.shape[1] + 1), dtype=dtype)
+            np.cumsum(~np.isnan(arr), axis=1, out=cumsum[:, 1:])
+            n = (cumsum[:, bounds[1:]] - cumsum[:, bounds[:-1]]).astype(np.int64)
+        rows = np.arange(arr.shape[0])[:, None]
+        valid = n > 0
+        last = np.maximum(n - 1, 0)
+
+        def _get(i: np.ndarray) -> np.ndarray:
+            # Getting the i-th sorted value of each row segment
+            return arr[rows, np.minimum(bounds[:-1] + i, arr.shape[1] - 1)]
+
+        def _quantile(q: float) -> np.ndarray:
+            # Same virtual index and interpolation as numpy's linear method
+            virtual = n * q + (1 + q * -1) - 1
+            prev = np.clip(np.floor(virtual).astype(np.int64), 0, last)
+            next_ = np.minimum(prev + 1, last)
+            gamma = virtual - prev
+            a = _get(prev)
+            b = _get(next_)
+            diff = b - a
+            return np.where(gamma >= 0.5, b - diff * (1 - gamma), a + diff * gamma)
+
+        # Getting the median (mean of the middle two values for an even number)
+        mid_lo = _get(np.maximum((n - 1) // 2, 0))
+        mid_hi = _get(np.minimum(n // 2, last))
+        median = np.where(n % 2 == 1, mid_lo, (mid_lo + mid_hi) / 2)
+        quantiles = {
+            "min": _get(np.zeros_like(n)),
+            "Q1": _quantile(0.25),
+            "median": median,
+            "Q3": _quantile(0.75),
+            "max": _get(last),
+        }
+        # Setting all-NaN rows to NaN
+        quantiles = {k: np.where(valid, v, np.nan) for k, v in quantiles.items()}
+        return {k: v[:, 0] for k, v in quantiles.items()} if single else quantiles
+
+    @staticmethod
+    def segment_moments(arr: np.ndarray, bounds: np.ndarray) -> dict[str, np.ndarray]:
+        """
+        Returns the mergeable count, sum, M2 (i.e. sum of squared deviations from the
+        mean), min, and max (ignoring NaNs) of each segment (i.e. columns
+        `bounds[k]:bounds[k + 1]`) of each row of the 2D `arr`, as `(rows, segments)`
+        arrays.
+        Computed with segment reductions over all segments at once.
+        The min and max of empty (or all-NaN) segments are NaN.
+        """
+        arr = arr[:, bounds[0] : bounds[-1]]
+        bounds = bounds - bounds[0]
+        lengths = np.diff(bounds)
+        nonempty = lengths > 0
+        seg_ids = np.repeat(np.arange(lengths.shape[0]), lengths)
+        notnan = ~np.isnan(arr)
+
+        def _reduce(ufunc: np.ufunc, x: np.ndarray, fill: float) -> np.ndarray:
+            # Reducing each non-empty segment (empty segments are `fill`)
+            out = np.full((x.shape[0], lengths.shape[0]), fill, dtype=x.dtype)
+            if np.any(nonempty):
+                out[:, nonempty] = ufunc.reduceat(x, bounds[:-1][nonempty], axis=1)
+            return out
+
+        count = _reduce(np.add, notnan.astype(np.int64), 0)
+        sum_ = _reduce(np.add, np.where(notnan, arr, 0), 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = sum_ / count
+        dev = np.where(notnan, arr - mean[:, seg_ids], 0)
+        return {
+            "count": count,
+            "sum": sum_,
+            "m2": _reduce(np.add, dev**2, 0),
+            "min": _reduce(np.fmin, arr, np.nan),
+            "max": _reduce(np.fmax, arr, np.nan),
+        }
+
+    @staticmethod
+    def merge_moments(
+        moments: dict[str, np.ndarray], groups: np.ndarray
+    ) -> dict[str, np.ndarray]:
+        """
+        Merges the `segment_moments` of each group of consecutive (non-empty) segments
+        (i.e. segments `groups[k]:groups[k + 1]`), with the parallel variance
+        algorithm (Chan et al.).
+        """
+        moments = {k: v[:, groups[0] : groups[-1]] for k, v in moments.items()}
+        starts = groups[:-1] - groups[0]
+        group_ids = np.repeat(np.arange(starts.shape[0]), np.diff(groups))
+        count = np.add.reduceat(moments["count"], starts, axis=1)
+        sum_ = np.add.reduceat(moments["sum"], starts, axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = sum_ / count
+            delta = moments["sum"] / moments["count"] - mean[:, group_ids]
+        delta = np.where(moments["count"] > 0, delta, 0)
+        return {
+            "count": count,
+            "sum": sum_,
+            "m2": np.add.reduceat(
+                moments["m2"] + moments["count"] * delta**2, starts, axis=1
+            ),
+            "min": np.fmin.reduceat(moments["min"], starts, axis=1),
+            "max": np.fmax.reduceat(moments["max"], starts, axis=1),
+        }
+
+    @classmethod
+    def segment_stats(
+        cls, arr: np.ndarray, bounds: np.ndarray
+    ) -> dict[str, np.ndarray]:
+        """
+        Returns the count, sum, mean, std, min, Q1, median, Q3, and max (ignoring NaNs)
+        of each segment (i.e. columns `bounds[k]:bounds[k + 1]`) of each row of the
+        2D `arr`, as `(rows, segments)` arrays.
+        Computed with segment reductions over all segments at once.
+
+        As in the summary funcs, empty segments are summarised as a single 0 value
+        (with a count of 0).
+        """
+        moments = cls.segment_moments(arr, bounds)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = moments["sum"] / moments["count"]
+            std = np.sqrt(moments["m2"] / moments["count"])
+        stats = {
+            "count": moments["count"],
+            "sum": moments["sum"],
+            "mean": mean,
+            "std": std,
+            **cls.nanquantiles(arr, bounds),
+        }
+        # Handling edge case where segments are empty
+        empty = np.diff(bounds) == 0
+        for v in stats.values():
+            v[:, empty] = 0
+        return stats
+
+    @classmethod
+    def segment_agg_quantitative(
+        cls, arr: np.ndarray, bounds: np.ndarray, fps: float
+    ) -> dict[str, np.ndarray]:
+        """
+        `agg_quantitative` of each segment (i.e. frames `bounds[k]:bounds[k + 1]`) of
+        the `(individual-measure, frames)` array, as `(individual-measure, segments)`
+        arrays.
+        """
+        groups = np.arange(bounds.shape[0])
+        return cls.multi_segment_agg_quantitative(arr, bounds, [groups], fps)[0]
+
+    @classmethod
+    def multi_segment_agg_quantitative(
+        cls, arr: np.ndarray, bounds: np.ndarray, groups_ls: list, fps: float
+    ) -> list[dict[str, np.ndarray]]:
+        """
+        `segment_agg_quantitative` for each grouping of the (finest) segments in
+        `groups_ls` (i.e. the bins are segments `groups[k]:groups[k + 1]`).
+
+        The additive moments (count, sum, M2, min, and max) are computed once for the
+        finest segments and merged for each grouping.
+        The quantiles are exact, from one argsort of each row and a stable (radix)
+        sort of the bin ids for each grouping.
+        """
+        moments = cls.segment_moments(arr, bounds)
+        order = np.argsort(arr, axis=1, kind="stable")
+        stats_ls = []
+        for groups in groups_ls:
+            bins_bounds = bounds[groups]
+            merged = cls.merge_moments(moments, groups)
+            quantiles = cls.nanquantiles(arr, bins_bounds, order)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                stats = {
+                    "mean": merged["sum"] / merged["count"],
+                    "std": np.sqrt(merged["m2"] / merged["count"]),
+                    "min": merged["min"],
+                    "Q1": quantiles["Q1"],
+                    "median": quantiles["median"],
+                    "Q3": quantiles["Q3"],
+                    "max": merged["max"],
+                }
+            # Handling edge case where bins are empty
+            empty = np.diff(bins_bounds) == 0
+            for v in stats.values():
+                v[:, empty] = 0
+            stats_ls.append(stats)
+        return stats_ls
+
     @classmethod
     def agg_behavs(cls, analysis_df: pd.DataFrame, fps: float) -> pd.DataFrame:
         """
@@ -129,13 +345,17 @@ class AnalyseBinnedDf(DFMixin):
         str
             The outcome string.
         """
+        # Getting duration of each behav bout of every individual-measure
+        bouts_df = BoutsDf.mat2bouts(analysis_df.values == 1)
+        # Getting the bouts bounds of each column (bouts are ordered by column)
+        bounds = np.searchsorted(
+            bouts_df["column_id"].values, np.arange(analysis_df.shape[1] + 1)
+        )
         # Getting summary stats for each individual
         summary_df_ls = np.zeros(analysis_df.shape[1], dtype="object")
         for i, col in enumerate(analysis_df.columns):
-            # Getting column vector of individual-measure
-            vect = analysis_df[col]
-            # Getting duration of each behav bout
-            bouts = BoutsDf.vect2bouts(vect == 1)["dur"]
+            # Getting duration of each behav bout of individual-measure
+            bouts = bouts_df["dur"].iloc[bounds[i] : bounds[i + 1]]
             # Converting bouts duration from frames to seconds
             bouts = bouts / fps
             # Getting bout frequency (before it is overwritten if empty)
@@ -171,6 +391,136 @@ class AnalyseBinnedDf(DFMixin):
         # Returning summary_df
         return summary_df
 
+    @classmethod
+    def segment_agg_behavs(
+        cls, arr: np.ndarray, bounds: np.ndarray, fps: float
+    ) -> dict[str, np.ndarray]:
+        """
+        `agg_behavs` of each segment (i.e. frames `bounds[k]:bounds[k + 1]`) of
+        the `(individual-measure, frames)` array, as `(individual-measure, segments)`
+        arrays.
+        Bouts are cut at the segment bounds.
+        """
+        groups = np.arange(bounds.shape[0])
+        return cls.multi_segment_agg_behavs(arr, bounds, [groups], fps)[0]
+
+    @classmethod
+    def multi_segment_agg_behavs(
+        cls, arr: np.ndarray, bounds: np.ndarray, groups_ls: list, fps: float
+    ) -> list[dict[str, np.ndarray]]:
+        """
+        `segment_agg_behavs` for each grouping of the (finest) segments in
+        `groups_ls` (i.e. the bins are segments `groups[k]:groups[k + 1]`).
+
+        The bouts are found once (over all frames), and cut at the bin bounds of
+        each grouping.
+        """
+        n_cols = arr.shape[0]
+        # Getting start and stop of each (uncut) bout
+        bouts_df = BoutsDf.mat2bouts(arr.T == 1)
+        column_id = bouts_df["column_id"].values
+        start = bouts_df["start"].values
+        stop = bouts_df["stop"].values
+        stats_ls = []
+        for groups in groups_ls:
+            bins_bounds = bounds[groups]
+            n_bins = bins_bounds.shape[0] - 1
+            # Getting the first and last bin of each bout (dropping bouts outside bins)
+            first = np.searchsorted(bins_bounds, start, side="right") - 1
+            last = np.searchsorted(bins_bounds, stop, side="right") - 1
+            kept = np.flatnonzero((last >= 0) & (first < n_bins))
+            first = np.maximum(first[kept], 0)
+            last = np.minimum(last[kept], n_bins - 1)
+            # Cutting each bout at the bin bounds (i.e. a piece in each bin)
+            n_pieces = last - first + 1
+            bout_ids = np.repeat(kept, n_pieces)
+            piece_bin = (
+                np.arange(bout_ids.shape[0])
+                - np.repeat(np.cumsum(n_pieces) - n_pieces, n_pieces)
+                + np.repeat(first, n_pieces)
+            )
+            piece_start = np.maximum(start[bout_ids], bins_bounds[piece_bin])
+            piece_stop = np.minimum(stop[bout_ids], bins_bounds[piece_bin + 1] - 1)
+            # Dropping pieces in empty bins
+            piece_ids = np.flatnonzero(piece_stop >= piece_start)
+            # Converting bouts duration from frames to seconds
+            durs = (piece_stop[piece_ids] - piece_start[piece_ids] + 1) / fps
+            # Getting the bouts bounds of each column-bin (bouts are ordered by both)
+            keys = column_id[bout_ids[piece_ids]] * n_bins + piece_bin[piece_ids]
+            keys_bounds = np.searchsorted(keys, np.arange(n_cols * n_bins + 1))
+            stats = cls.segment_stats(durs[None, :], keys_bounds)
+            stats = {k: v.reshape(n_cols, n_bins) for k, v in stats.items()}
+            stats_ls.append(
+                {
+                    "bout_freq": stats["count"].astype(np.float64),
+                    "bout_dur_total": stats["sum"],
+                    **{
+                        f"bout_dur_{k}": stats[k]
+                        for k in ("mean", "std", "min", "Q1", "median", "Q3", "max")
+                    },
+                }
+            )
+        return stats_ls
+
+    @staticmethod
+    def get_bins(timestamps: np.ndarray, bins_: list) -> np.ndarray:
+        """
+        Returns the bin edges of `bins_`, ensuring all bins are included
+        (start frame and end frame).
+        """
+        bins = np.asarray(bins_)
+        bins = np.append(0, bins) if np.min(bins) > 0 else bins
+        t_max = np.max(timestamps)
+        bins = np.append(bins, t_max) if np.max(bins) < t_max else bins
+        if np.any(np.diff(bins) <= 0):
+            raise ValueError("bins must increase monotonically.")
+        return bins
+
+    @staticmethod
+    def get_elem_ids(timestamps: np.ndarray, edges: np.ndarray) -> np.ndarray:
+        """
+        Returns the elementary segment id of each timestamp for the sorted `edges`.
+        The segments are each edge and each open interval between edges, i.e.
+        `{edges[0]}, (edges[0], edges[1]), {edges[1]}, ...` (ids 0, 1, 2, ...).
+
+        Every `(bins[i], bins[i + 1]]` bin (with the first bin including its lower
+        edge, as in `pd.cut(..., include_lowest=True)`) with edges in `edges` is thus
+        a contiguous range of segment ids.
+        Timestamps outside the edges have a segment id of -1.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        ids = np.searchsorted(edges, timestamps, side="left")
+        on_edge = edges[np.minimum(ids, edges.shape[0] - 1)] == timestamps
+        ids = np.where(on_edge, 2 * ids, 2 * ids - 1)
+        ids[(ids >= 2 * edges.shape[0] - 1) | np.isnan(timestamps)] = -1
+        return ids
+
+    @classmethod
+    def make_binned_df(
+        cls,
+        values: np.ndarray,
+        bins: np.ndarray,
+        columns: pd.MultiIndex,
+        aggs: list[str],
+    ) -> pd.DataFrame:
+        """
+        Makes the binned df from the `(bins, columns, aggs)` values array
+        (ordered by individuals, measures, then aggs).
+        """
+        return pd.DataFrame(
+            values.reshape(values.shape[0], -1),
+            index=pd.CategoricalIndex(
+                bins[1:],
+                categories=bins[1:],
+                ordered=True,
+                name=AnalyseBinnedIN.BIN_SEC.value,
+            ),
+            columns=pd.MultiIndex.from_tuples(
+                [(*col, agg) for col in columns for agg in aggs],
+                names=MiscMixin.enum2tuple(cls.CN),
+            ),
+        ).sort_index(axis=1)
+
     @classmethod
     def make_binned(
         cls,
@@ -183,25 +533,75 @@ class AnalyseBinnedDf(DFMixin):
         Generates the binned data and line graph for the given analysis_df, and given bin_sec.
         The aggregated statistics are very similar to the summary data.
         """
-        # For each column, displays the mean of each binned group.
+        return cls.make_binned_multi(analysis_df, fps, [bins_], summary_func)[0]
+
+    @classmethod
+    def make_binned_multi(
+        cls,
+        analysis_df: pd.DataFrame,
+        fps: float,
+        bins_ls: list[list],
+        summary_func: Callable[[pd.DataFrame, float], pd.DataFrame],
+    ) -> list[pd.DataFrame]:
+        """
+        `make_binned` for each bins in `bins_ls`, in a single pass over the frames.
+
+        The frames are given the elementary segment ids of the union of all bin edges
+        (see `get_elem_ids`) and sorted (stably) by segment, so each bin (of every
+        bins) is a contiguous set of rows and of segments.
+        `agg_quantitative` and `agg_behavs` are computed for all bins and columns at
+        once, with the additive aggregates computed for the segments and rolled up to
+        each bins. Other summary funcs are called on each bin's rows.
+        """
         timestamps = analysis_df.index.get_level_values("frame") / fps
-        # Ensuring all bins are included (start frame and end frame)
-        bins = np.asarray(bins_)
-        bins = np.append(0, bins) if np.min(bins) > 0 else bins
-        t_max = np.max(timestamps)
-        bins = np.append(bins, t_max) if np.max(bins) < t_max else bins
+        bins_ls = [cls.get_bins(timestamps, bins_) for bins_ in bins_ls]
+        edges = np.unique(np.concatenate(bins_ls))
+        # Getting the segment of each frame (and sorting frames by segment)
+        elem_ids = cls.get_elem_ids(timestamps, edges)
+        order = np.flatnonzero(elem_ids >= 0)
+        order = order[np.argsort(elem_ids[order], kind="stable")]
+        bounds = np.searchsorted(elem_ids[order], np.arange(2 * edges.shape[0]))
+        # Getting the segments of each bin (the first bin includes its lower edge)
+        groups_ls = []
+        for bins in bins_ls:
+            edge_ids = np.searchsorted(edges, bins)
+            groups_ls.append(np.append(2 * edge_ids[0], 2 * edge_ids[1:] + 1))
         # Making binned data
-        bin_sec = pd.cut(timestamps, bins=bins, labels=bins[1:], include_lowest=True)
-        grouped_df = analysis_df.groupby(bin_sec)
-        binned_df = grouped_df.apply(
-            lambda x: summary_func(x, fps)
-            .unstack(MiscMixin.enum2tuple(AnalyseDf.CN))
-            .reorder_levels(list(MiscMixin.enum2tuple(cls.CN)))
-            .sort_index(level=MiscMixin.enum2tuple(AnalyseDf.CN))
-        )
-        binned_df.index.names = MiscMixin.enum2tuple(AnalyseBinnedIN)
-        # returning binned_df
-        return binned_df
+        multi_segment_funcs = {
+            cls.agg_quantitative: cls.multi_segment_agg_quantitative,
+            cls.agg_behavs: cls.multi_segment_agg_behavs,
+        }
+        binned_df_ls = []
+        if summary_func in multi_segment_funcs:
+            arr = analysis_df.to_numpy(dtype=np.float64).T[:, order]
+            func = multi_segment_funcs[summary_func]
+            for bins, aggs_dict in zip(bins_ls, func(arr, bounds, groups_ls, fps)):
+                # (bins, columns, aggs) array
+                values = np.stack(list(aggs_dict.values()), axis=-1).transpose(1, 0, 2)
+                binned_df_ls.append(
+                    cls.make_binned_df(
+                        values, bins, analysis_df.columns, list(aggs_dict.keys())
+                    )
+                )
+        else:
+            sorted_df = analysis_df.iloc[order]
+            for bins, groups in zip(bins_ls, groups_ls):
+                bins_bounds = bounds[groups]
+                summary_df_ls = [
+                    summary_func(sorted_df.iloc[i:j], fps)
+                    for i, j in zip(bins_bounds[:-1], bins_bounds[1:])
+                ]
+                values = np.stack([i.to_numpy(dtype=np.float64) for i in summary_df_ls])
+                binned_df_ls.append(
+                    cls.make_binned_df(
+                        values,
+                        bins,
+                        summary_df_ls[0].index,
+                        list(summary_df_ls[0].columns),
+                    )
+                )
+        # returning binned_df_ls
+        return binned_df_ls
 
     @staticmethod
     def make_binned_plot(
@@ -212,35 +612,7 @@ class AnalyseBinnedDf(DFMixin):
         """
         _summary_
         """
-        # Making binned_df long
-        binned_stacked_df = (
-            binned_df.stack(MiscMixin.enum2tuple(AnalyseDf.CN))[agg_column]
-            .rename("value")
-            .reset_index()
-        )
-        # Plotting line graph
-        g = sns.relplot(
-            data=binned_stacked_df,
-            x=AnalyseBinnedIN.BIN_SEC.value,
-            y="value",
-            hue="measures",
-            col="individuals",
-            kind="line",
-            height=4,
-            aspect=1.5,
-            alpha=0.5,
-            marker="X",
-            markersize=10,
-            legend=True,
-        )
-        # Setting fig titles and labels
-        g.set_titles(col_template="{col_name}")
-        g.figure.subplots_adjust(top=0.85)
-        g.figure.suptitle("Binned data", fontsize=12)
-        # Saving fig
-        os.makedirs(os.path.split(out_fp)[0], exist_ok=True)
-        g.savefig(out_fp)
-        g.figure.clf()
+        PlotMixin.binned_plot(binned_df, out_fp, agg_column)
 
     @classmethod
     def summary_binned_quantitative(
@@ -251,6 +623,8 @@ class AnalyseBinnedDf(DFMixin):
         fps: float,
         bins_ls: list,
         cbins_ls: list,
+        plot: bool = True,
+        plot_queue: None | PlotQueue = None,
     ) -> str:
         """
         _summary_
@@ -264,6 +638,8 @@ class AnalyseBinnedDf(DFMixin):
             agg_column="mean",
             bins_ls=bins_ls,
             cbins_ls=cbins_ls,
+            plot=plot,
+            plot_queue=plot_queue,
         )
 
     @classmethod
@@ -275,6 +651,8 @@ class AnalyseBinnedDf(DFMixin):
         fps: float,
         bins_ls: list,
         cbins_ls: list,
+        plot: bool = True,
+        plot_queue: None | PlotQueue = None,
     ) -> str:
         """
         _summary_
@@ -288,6 +666,8 @@ class AnalyseBinnedDf(DFMixin):
             agg_column="bout_dur_total",
             bins_ls=bins_ls,
             cbins_ls=cbins_ls,
+            plot=plot,
+            plot_queue=plot_queue,
         )
 
     @classmethod
@@ -301,42 +681,426 @@ class AnalyseBinnedDf(DFMixin):
         agg_column: str,
         bins_ls: list,
         cbins_ls: list,
+        plot: bool = True,
+        plot_queue: None | PlotQueue = None,
     ) -> str:
         """
         _summary_
+
+        If `plot` is False, the binned plots are not made
+        (they can be made later with `summary_binned_plots`).
+        If a `plot_queue` is given, the binned plots are deferred to it
+        (rather than made inline).
         """
         outcome = ""
         # Offsetting the frames index to start from 0 (i.e. when the experiment
         # started, rather than when the recording started)
         analysis_df.index = analysis_df.index - analysis_df.index[0]
-        # Summarising analysis_df
-        summary_fp = os.path.join(out_dir, "summary", f"{name}.feather")
-        summary_df = summary_func(analysis_df, fps)
-        DFMixin.write_feather(summary_df, summary_fp)
-        # Getting timestamps index
-        timestamps = analysis_df.index.get_level_values("frame") / fps
-        # Binning analysis_df
-        for bin_sec in bins_ls:
-            # Making filepaths
-            binned_fp = os.path.join(out_dir, f"binned_{bin_sec}", f"{name}.feather")
-            binned_plot_fp = os.path.join(
-                out_dir, f"binned_{bin_sec}_plot", f"{name}.png"
+        # Writing outputs in the background while computing the next
+        with DFWriter() as writer:
+            # Summarising analysis_df
+            summary_fp = os.path.join(out_dir, "summary", f"{name}.feather")
+            summary_df = summary_func(analysis_df, fps)
+            writer.put(DFMixin.write_feather, summary_df, summary_fp)
+            # Getting timestamps index
+            timestamps = analysis_df.index.get_level_values("frame") / fps
+            # Making the binned dfs of all bins at once
+            bins_dict = {
+                f"binned_{bin_sec}": np.arange(0, np.max(timestamps) + bin_sec, bin_sec)
+                for bin_sec in bins_ls
+            }
+            # Custom binning analysis_df
+            if cbins_ls:
+                bins_dict["binned_custom"] = cbins_ls
+            binned_df_ls = cls.make_binned_multi(
+                analysis_df, fps, list(bins_dict.values()), summary_func
             )
-            # Making binned df
-            bins = np.arange(0, np.max(timestamps) + bin_sec, bin_sec)
-            binned_df = cls.make_binned(analysis_df, fps, bins, summary_func)
-            cls.write_feather(binned_df, binned_fp)
-            # Making binned plots
-            cls.make_binned_plot(binned_df, binned_plot_fp, agg_column)
-        # Custom binning analysis_df
-        if cbins_ls:
-            # Making filepaths
-            binned_fp = os.path.join(out_dir, "binned_custom", f"{name}.feather")
-            binned_plot_fp = os.path.join(out_dir, "binned_custom_plot", f"{name}.png")
-            # Making binned df
-            binned_df = cls.make_binned(analysis_df, fps, cbins_ls, summary_func)
-            cls.write_feather(binned_df, binned_fp)
-            # Making binned plots
-            cls.make_binned_plot(binned_df, binned_plot_fp, agg_column)
+            for binned_name, binned_df in zip(bins_dict, binned_df_ls):
+                # Making filepaths
+                binned_fp = os.path.join(out_dir, binned_name, f"{name}.feather")
+                binned_plot_fp = os.path.join(
+                    out_dir, f"{binned_name}_plot", f"{name}.png"
+                )
+                writer.put(cls.write_feather, binned_df, binned_fp)
+                # Making binned plots
+                if plot and plot_queue is not None:
+                    plot_queue.put(
+                        PlotSpec(
+                            kind=PlotKinds.BINNED.value,
+                            data_fp=binned_fp,
+                            out_fp=binned_plot_fp,
+                            column=agg_column,
+                        )
+                    )
+                elif plot:
+                    cls.make_binned_plot(binned_df, binned_plot_fp, agg_column)
         # Returning outcome
         return outcome
+
+    @classmethod
+    def summary_binned_plots(cls, out_dir: str, name: str, agg_column: str) -> str:
+        """
+        Makes the binned plots of the experiment from the binned dfs already written
+        by `summary_binned` (i.e. `<out_dir>/binned_<bin_sec>/<name>.feather`).
+        """
+        outcome = ""
+        for binned_name in sorted(os.listdir(out_dir)):
+            binned_fp = os.path.join(out_dir, binned_name, f"{name}.feather")
+            if not binned_name.startswith(BINNED) or not os.path.isfile(binned_fp):
+                continue
+            binned_plot_fp = os.path.join(out_dir, f"{binned_name}_plot", f"{name}.png")
+            binned_df = cls.read_feather(binned_fp)
+            cls.make_binned_plot(binned_df, binned_plot_fp, agg_column)
+        return outcome
+
+    @classmethod
+    def _summary_binned_worker(
+        cls, job: dict, plot: bool
+    ) -> tuple[str, list[PlotSpec]]:
+        """
+        Runs the `summary_binned_batch` job (loading its analysis df once).
+        Returns the outcome and the (deferred) plot specs.
+        """
+        plot_queue = PlotQueue(enabled=plot)
+        try:
+            analysis_df = AnalyseDf.read(job["analysis_fp"])
+            summary_binned_func = (
+                cls.summary_binned_behavs
+                if job.get("behavs", False)
+                else cls.summary_binned_quantitative
+            )
+            outcome = summary_binned_func(
+                analysis_df=analysis_df,
+                out_dir=job["out_dir"],
+                name=job["name"],
+                fps=job["fps"],
+                bins_ls=job["bins_ls"],
+                cbins_ls=job.get("cbins_ls", []),
+                plot=plot,
+                plot_queue=plot_queue,
+            )
+            return outcome, plot_queue.specs
+        except Exception as e:
+            return f"ERROR: {job['name']} failed to summarise.\n{e}\n", []
+
+    @classmethod
+    def summary_binned_batch(
+        cls,
+        jobs: list[dict],
+        plot: bool = True,
+        max_workers: None | int = None,
+    ) -> list[str]:
+        """
+        Runs `summary_binned` for many experiments on a process pool
+        (sized to the machine's CPUs by default).
+
+        Each job is a dict with the `analysis_fp` (the analysis df filepath),
+        `out_dir`, `name`, `fps`, `bins_ls`, and optionally the `cbins_ls` and
+        `behavs` (whether it is behaviour classification data, default False) keys.
+        Each worker loads the job's analysis df once and computes all its bins.
+        If `plot`, the binned plots are deferred and rendered in batches
+        (see `PlotQueue`) after all jobs are computed.
+
+        Returns the outcome string of each job (in the order of `jobs`),
+        including the outcomes of its rendered plots.
+        A failed job's (or plot's) outcome is its error, rather than stopping
+        the other jobs.
+        """
+        max_workers = max_workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(cls._summary_binned_worker, job, plot) for job in jobs
+            ]
+            results = [future.result() for future in futures]
+        # Rendering the deferred plots
+        plot_queue = PlotQueue(enabled=plot, max_workers=max_workers)
+        for _, specs in results:
+            plot_queue.extend(specs)
+        plot_outcomes = plot_queue.render()
+        # Adding each job's plot outcomes to its outcome
+        outcomes = []
+        for outcome, specs in results:
+            outcomes.append(outcome + "".join(plot_outcomes[: len(specs)]))
+            plot_outcomes = plot_outcomes[len(specs) :]
+        return outcomes
+
+
+####################################################################################################
+# QUANTILE SKETCH CLASS
+####################################################################################################
+
+
+class QuantileSketch:
+    """
+    KLL-style mergeable quantile sketch of a stream of values (NaNs are ignored).
+
+    Values are kept in a hierarchy of compactors, where a value at level `h` has a
+    weight of `2**h`. When a level is over its capacity, it is sorted and every
+    other value (with a random offset) is promoted to the next level.
+    The capacity of the top level is `k = ceil(2.66 / eps)`, giving a rank error of
+    about `eps` (with 99% confidence), and the sketch keeps `O(k log(n / k))` values.
+    Quantiles are exact until the first compaction (i.e. while few values are added).
+    """
+
+    __slots__ = ("k", "n", "levels", "rng")
+
+    def __init__(self, eps: float = 0.01, seed: None | int = None):
+        self.k = int(np.ceil(2.66 / eps))
+        self.n = 0
+        self.levels = [np.zeros(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def _get_capacity(self, h: int) -> int:
+        """Returns the capacity of level `h` (shrinking geometrically below the top)."""
+        return max(2, int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - 1 - h))))
+
+    def _compress(self) -> None:
+        """Compacts each level that is over its capacity."""
+        h = 0
+        while h < len(self.levels):
+            if self.levels[h].shape[0] > self._get_capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.zeros(0))
+                level = np.sort(self.levels[h])
+                # Keeping one value at this level if there is an odd number
+                odd = level.shape[0] % 2
+                promoted = level[odd:][self.rng.integers(2) :: 2]
+                self.levels[h] = level[:odd]
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+    def update(self, values: np.ndarray) -> None:
+        """Adds the values (NaNs are ignored) to the sketch."""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.n += values.shape[0]
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: QuantileSketch) -> None:
+        """Merges the other sketch into this sketch."""
+        for h, level in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(np.zeros(0))
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self.n += other.n
+        self._compress()
+
+    def quantile(self, q: float | np.ndarray) -> float | np.ndarray:
+        """
+        Returns the (approximate) q-th quantiles of the values.
+        NaN if there are no values.
+        """
+        if self.n == 0:
+            return np.full(np.shape(q), np.nan)[()]
+        # Exact quantiles (same as `np.quantile`) if nothing is compacted
+        if len(self.levels) == 1:
+            return np.quantile(self.levels[0], q)
+        # Getting the weighted rank of each value
+        values = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [np.full(level.shape[0], 2**h) for h, level in enumerate(self.levels)]
+        )
+        order = np.argsort(values, kind="stable")
+        cumsum = np.cumsum(weights[order])
+        ids = np.searchsorted(cumsum, np.asarray(q) * (self.n - 1), side="right")
+        return values[order][np.minimum(ids, values.shape[0] - 1)]
+
+
+####################################################################################################
+# STREAMING AGGREGATOR CLASSES
+####################################################################################################
+
+
+class SummaryAggregator(ABC):
+    """
+    Online (out-of-core) summary of analysis dfs, fed with frame chunks.
+
+    Keeps exact count, sum, M2 (i.e. sum of squared deviations), min, and max states,
+    and a `QuantileSketch` (with the `eps` rank error) for each individual-measure
+    column. States merge exactly (and sketches approximately), so the summaries of
+    multiple experiments can be merged for group-level summaries.
+    """
+
+    def __init__(self, columns: pd.Index, fps: float, eps: float = 0.01):
+        self.columns = columns
+        self.fps = fps
+        self.frames = 0
+        n = columns.shape[0]
+        self.moments = {
+            "count": np.zeros((n, 1), dtype=np.int64),
+            "sum": np.zeros((n, 1)),
+            "m2": np.zeros((n, 1)),
+            "min": np.full((n, 1), np.nan),
+            "max": np.full((n, 1), np.nan),
+        }
+        self.sketches = [QuantileSketch(eps) for _ in range(n)]
+
+    @classmethod
+    def from_chunks(
+        cls, chunks: Iterable[pd.DataFrame], fps: float, eps: float = 0.01
+    ) -> SummaryAggregator:
+        """
+        Makes the aggregator and updates it with each chunk
+        (e.g. from `DFMixin.read_h5(fp, chunksize=...)`).
+        """
+        aggregator = None
+        for chunk in chunks:
+            aggregator = aggregator or cls(chunk.columns, fps, eps)
+            aggregator.update(chunk)
+        assert aggregator is not None, "There are no chunks to summarise."
+        return aggregator
+
+    def _update_moments(self, moments: dict[str, np.ndarray]) -> None:
+        """Merges the `(columns, 1)` moments into the state."""
+        moments = {
+            k: np.concatenate([v, moments[k]], axis=1) for k, v in self.moments.items()
+        }
+        self.moments = AnalyseBinnedDf.merge_moments(moments, np.array([0, 2]))
+
+    @abstractmethod
+    def update(self, chunk_df: pd.DataFrame) -> None:
+        """Updates the summary with the next frames chunk."""
+
+    def merge(self, other: SummaryAggregator) -> None:
+        """Merges the other (experiment's) summary into this summary."""
+        assert self.columns.equals(other.columns), "The columns must be the same."
+        self.frames += other.frames
+        self._update_moments(other.moments)
+        for sketch, other_sketch in zip(self.sketches, other.sketches):
+            sketch.merge(other_sketch)
+
+    def get_quantiles(self) -> dict[str, np.ndarray]:
+        """Returns the Q1, median, and Q3 of each column from the sketches."""
+        quantiles = np.array([i.quantile([0.25, 0.5, 0.75]) for i in self.sketches])
+        quantiles = quantiles.reshape(-1, 3)
+        return {"Q1": quantiles[:, 0], "median": quantiles[:, 1], "Q3": quantiles[:, 2]}
+
+    @abstractmethod
+    def to_df(self) -> pd.DataFrame:
+        """Returns the summary df (the same as the summary func's)."""
+
+
+class QuantitativeAggregator(SummaryAggregator):
+    """
+    Online `AnalyseBinnedDf.agg_quantitative` (see `SummaryAggregator`).
+    """
+
+    def update(self, chunk_df: pd.DataFrame) -> None:
+        arr = chunk_df.to_numpy(dtype=np.float64).T
+        self.frames += arr.shape[1]
+        self._update_moments(
+            AnalyseBinnedDf.segment_moments(arr, np.array([0, arr.shape[1]]))
+        )
+        for sketch, vect in zip(self.sketches, arr):
+            sketch.update(vect)
+
+    def to_df(self) -> pd.DataFrame:
+        count = self.moments["count"][:, 0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            summary_dict = {
+                "mean": self.moments["sum"][:, 0] / count,
+                "std": np.sqrt(self.moments["m2"][:, 0] / count),
+            }
+        quantiles = self.get_quantiles()
+        summary_dict = {
+            **summary_dict,
+            "min": self.moments["min"][:, 0],
+            "Q1": quantiles["Q1"],
+            "median": quantiles["median"],
+            "Q3": quantiles["Q3"],
+            "max": self.moments["max"][:, 0],
+        }
+        summary_df = pd.DataFrame(summary_dict, index=self.columns)
+        # Handling edge case where there are no frames
+        if self.frames == 0:
+            summary_df.loc[:, :] = 0.0
+        summary_df.columns.name = AnalyseBinnedDf.CN.AGGS.value
+        return summary_df
+
+
+class BehavsAggregator(SummaryAggregator):
+    """
+    Online `AnalyseBinnedDf.agg_behavs` (see `SummaryAggregator`).
+    The states are of the bout durations (in frames).
+
+    Bouts open at the end of a chunk are carried over and stitched to the bouts
+    at the start of the next chunk. They are closed by `close`
+    (called by `merge` and `to_df`), as bouts do not span experiments.
+    """
+
+    def __init__(self, columns: pd.Index, fps: float, eps: float = 0.01):
+        super().__init__(columns, fps, eps)
+        # Duration of the bout open at the end of the last chunk
+        self.carry = np.zeros(columns.shape[0], dtype=np.int64)
+
+    def _update_bouts(self, column_id: np.ndarray, dur: np.ndarray) -> None:
+        """Adds the (closed) bouts' durations to the states."""
+        order = np.argsort(column_id, kind="stable")
+        column_id, dur = column_id[order], dur[order].astype(np.float64)
+        bounds = np.searchsorted(column_id, np.arange(self.columns.shape[0] + 1))
+        moments = AnalyseBinnedDf.segment_moments(dur[None, :], bounds)
+        self._update_moments({k: v.T for k, v in moments.items()})
+        for i in np.flatnonzero(np.diff(bounds)):
+            self.sketches[i].update(dur[bounds[i] : bounds[i + 1]])
+
+    def update(self, chunk_df: pd.DataFrame) -> None:
+        n = chunk_df.shape[0]
+        if n == 0:
+            return
+        self.frames += n
+        pos = chunk_df.to_numpy() == 1
+        bouts_df = BoutsDf.mat2bouts(pos)
+        column_id = bouts_df["column_id"].values
+        dur = bouts_df["dur"].values
+        # Stitching the bouts open at the end of the last chunk
+        carry = self.carry
+        dur = dur + np.where(bouts_df["start"].values == 0, carry[column_id], 0)
+        closed = np.flatnonzero((carry > 0) & ~pos[0])
+        # Carrying over the bouts open at the end of this chunk
+        is_open = bouts_df["stop"].values == n - 1
+        self.carry = np.zeros_like(carry)
+        self.carry[column_id[is_open]] = dur[is_open]
+        # Adding the closed bouts
+        self._update_bouts(
+            np.concatenate([column_id[~is_open], closed]),
+            np.concatenate([dur[~is_open], carry[closed]]),
+        )
+
+    def close(self) -> None:
+        """Closes the bouts open at the end of the last chunk."""
+        closed = np.flatnonzero(self.carry > 0)
+        self._update_bouts(closed, self.carry[closed])
+        self.carry = np.zeros_like(self.carry)
+
+    def merge(self, other: BehavsAggregator) -> None:
+        self.close()
+        other.close()
+        super().merge(other)
+
+    def to_df(self) -> pd.DataFrame:
+        self.close()
+        count = self.moments["count"][:, 0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            summary_dict = {
+                "bout_freq": count.astype(np.float64),
+                "bout_dur_total": self.moments["sum"][:, 0],
+                "bout_dur_mean": self.moments["sum"][:, 0] / count,
+                "bout_dur_std": np.sqrt(self.moments["m2"][:, 0] / count),
+            }
+        quantiles = self.get_quantiles()
+        summary_dict = {
+            **summary_dict,
+            "bout_dur_min": self.moments["min"][:, 0],
+            "bout_dur_Q1": quantiles["Q1"],
+            "bout_dur_median": quantiles["median"],
+            "bout_dur_Q3": quantiles["Q3"],
+            "bout_dur_max": self.moments["max"][:, 0],
+        }
+        # Converting bouts duration from frames to seconds
+        summary_df = pd.DataFrame(summary_dict, index=self.columns)
+        summary_df.iloc[:, 1:] = summary_df.iloc[:, 1:] / self.fps
+        # Handling edge case where there are no bouts
+        summary_df.loc[count == 0, :] = 0.0
+        summary_df.columns.name = AnalyseBinnedDf.CN.AGGS.value
+        return summary_df
@@ -0,0 +1,156 @@
+"""
+Utility functions.
+"""
+
+from __future__ import annotations
+
+from enum import Enum
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from behavysis_pipeline.df_classes.analyse_df import FBF
+
+####################################################################################################
+# DATASET CONSTANTS
+####################################################################################################
+
+
+class AnalyseDatasetPartitions(Enum):
+    ANALYSIS = "analysis"
+    OUTPUT = "output"
+    BIN_SIZE = "bin_size"
+    EXPERIMENT = "experiment"
+
+
+# Schema of the long-format rows (i.e. one value per row) in the dataset
+DATA_SCHEMA = pa.schema(
+    [
+        ("frame", pa.int64()),
+        ("bin_sec", pa.float64()),
+        ("individuals", pa.string()),
+        ("measures", pa.string()),
+        ("aggs", pa.string()),
+        ("value", pa.float64()),
+    ]
+)
+
+PARTITIONS_SCHEMA = pa.schema(
+    [
+        (AnalyseDatasetPartitions.ANALYSIS.value, pa.string()),
+        (AnalyseDatasetPartitions.OUTPUT.value, pa.string()),
+        (AnalyseDatasetPartitions.BIN_SIZE.value, pa.int64()),
+        (AnalyseDatasetPartitions.EXPERIMENT.value, pa.string()),
+    ]
+)
+
+####################################################################################################
+# DATASET CLASS
+####################################################################################################
+
+
+class AnalyseDataset:
+    """
+    Project-wide hive-partitioned parquet dataset of analysis outputs
+    (`AnalyseDf`, `AnalyseBinnedDf` and summary, and `AnalyseCombinedDf` dfs).
+
+    The outputs are stored in long format (one value per row) and partitioned by
+    analysis, output (fbf, summary, binned, custom), bin size, and experiment, i.e.
+    ```
+    <root_dir>/analysis=<analysis>/output=<output>/bin_size=<bin_size>/experiment=<experiment>/
+    ```
+    Reads push filters down to the partitions and parquet statistics, so only the
+    matching fragments are read.
+    """
+
+    @staticmethod
+    def get_partitioning() -> ds.Partitioning:
+        """Returns the hive partitioning of the dataset."""
+        return ds.partitioning(PARTITIONS_SCHEMA, flavor="hive")
+
+    @staticmethod
+    def df2long(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Converts the (wide) analysis df to long format, with the index and column
+        levels as columns and the values in the "value" column.
+        """
+        levels = list(range(df.columns.nlevels))
+        long_df = df.stack(levels, future_stack=True).rename("value").reset_index()
+        return long_df
+
+    @classmethod
+    def write(
+        cls,
+        df: pd.DataFrame,
+        root_dir: str,
+        experiment: str,
+        analysis: None | str = None,
+        output: str = FBF,
+        bin_size: None | int = None,
+    ) -> None:
+        """
+        Writes the analysis df of the experiment to the dataset.
+        Replaces the experiment's existing data for the same analysis, output,
+        and bin size.
+
+        `analysis` must be given, unless the df has an "analysis" column level
+        (i.e. an `AnalyseCombinedDf`).
+        `output` is one of fbf, summary, binned, or custom.
+        `bin_size` is the bin size in seconds (only for binned outputs).
+        """
+        long_df = cls.df2long(df)
+        # Adding the partition columns
+        if analysis is not None:
+            long_df[AnalyseDatasetPartitions.ANALYSIS.value] = analysis
+        assert (
+            AnalyseDatasetPartitions.ANALYSIS.value in long_df.columns
+        ), "The analysis name must be given or be a column level of the df."
+        long_df[AnalyseDatasetPartitions.OUTPUT.value] = output
+        long_df[AnalyseDatasetPartitions.BIN_SIZE.value] = bin_size
+        long_df[AnalyseDatasetPartitions.EXPERIMENT.value] = experiment
+        # Making the table with the dataset schema (missing columns are null)
+        schema = pa.unify_schemas([DATA_SCHEMA, PARTITIONS_SCHEMA])
+        for field in DATA_SCHEMA:
+            if field.name not in long_df.columns:
+                long_df[field.name] = None
+        table = pa.Table.from_pandas(
+            long_df[schema.names], schema=schema, preserve_index=False
+        )
+        # Writing the table's partitions
+        ds.write_dataset(
+            table,
+            root_dir,
+            format="parquet",
+            partitioning=cls.get_partitioning(),
+            existing_data_behavior="delete_matching",
+            basename_template="part-{i}.parquet",
+        )
+
+    @classmethod
+    def read(
+        cls,
+        root_dir: str,
+        filters: None | list[tuple] | list[list[tuple]] = None,
+        columns: None | list[str] = None,
+    ) -> pd.DataFrame:
+        """
+        Reads the (long format) analysis outputs from the dataset.
+
+        `filters` are in the `pyarrow.parquet` filters format, and can be on any
+        data or partition column, e.g. one measure across all experiments for
+        bin sizes up to 600 sec:
+        ```
+        [("measures", "==", "speed"), ("output", "==", "binned"), ("bin_size", "<=", 600)]
+        ```
+        `columns` are the columns to read (default is all).
+        """
+        dataset = ds.dataset(
+            root_dir,
+            schema=pa.unify_schemas([DATA_SCHEMA, PARTITIONS_SCHEMA]),
+            format="parquet",
+            partitioning=cls.get_partitioning(),
+        )
+        expr = pq.filters_to_expression(filters) if filters else None
+        table = dataset.to_table(columns=columns, filter=expr)
+        return table.to_pandas()
@@ -22,10 +22,10 @@ import os
 from enum import Enum
 
 import pandas as pd
-import seaborn as sns
 from behavysis_pipeline.df_classes.df_mixin import DFMixin, FramesIN
-from behavysis_pipeline.df_classes.keypoints_df import Coords
+from behavysis_pipeline.mixins.plot_mixin import PlotKinds, PlotMixin, PlotQueue
 from behavysis_pipeline.pydantic_models.experiment_configs import ExperimentConfigs
+from behavysis_pipeline.pydantic_models.plot_spec import PlotSpec
 
 ####################################################################################################
 # DF CONSTANTS
@@ -94,61 +94,42 @@ class AnalyseDf(DFMixin):
 
     @staticmethod
     def make_location_scatterplot(
-        scatter_df: pd.DataFrame, corners_df: pd.DataFrame, out_fp, measure: str
+        scatter_df: pd.DataFrame,
+        corners_df: pd.DataFrame,
+        out_fp,
+        measure: str,
+        density: bool = False,
+        plot_queue: None | PlotQueue = None,
     ):
         """
         Expects analysis_df index levels to be (frame,),
         and column levels to be (individual, measure).
+
+        If `density` is True, the locations are drawn as a rasterised 2D histogram
+        (fast for long recordings) instead of a scatter plot.
+        If a `plot_queue` is given, the plot is deferred to it (rather than made
+        inline), and the scatter and corners dfs are written beside the plot
+        (i.e. `<out_fp stem>.feather` and `<out_fp stem>_corners.feather`).
         """
-        scatter_stacked_df = scatter_df.stack(level="individuals").reset_index(
-            "individuals"
-        )
-        g = sns.relplot(
-            data=scatter_stacked_df,
-            x=Coords.X.value,
-            y=Coords.Y.value,
-            hue=measure,
-            col="individuals",
-            kind="scatter",
-            col_wrap=2,
-            height=8,
-            aspect=0.5 * scatter_stacked_df["individuals"].nunique(),
-            alpha=0.8,
-            linewidth=0,
-            marker=".",
-            s=10,
-            legend=True,
-        )
-        # Invert the y axis
-        g.axes[0].invert_yaxis()
-        # Adding region definition (from roi_df) to the plot
-        corners_df = pd.concat(
-            [corners_df, corners_df.groupby("roi").first().reset_index()],
-            ignore_index=True,
-        )
-        for ax in g.axes:
-            sns.lineplot(
-                data=corners_df,
-                x=Coords.X.value,
-                y=Coords.Y.value,
-                hue="roi",
-                # color=(1, 0, 0),
-                linewidth=1,
-                marker="+",
-                markeredgecolor=(1, 0, 0),
-                markeredgewidth=2,
-                markersize=5,
-                estimator=None,
-                sort=False,
-                legend=False,
-                ax=ax,
+        if plot_queue is not None:
+            if not plot_queue.enabled:
+                return
+            out_stem = os.path.splitext(out_fp)[0]
+            scatter_fp = f"{out_stem}.feather"
+            corners_fp = f"{out_stem}_corners.feather"
+            DFMixin.write_feather(scatter_df, scatter_fp)
+            DFMixin.write_feather(corners_df, corners_fp)
+            kind = PlotKinds.LOCATION_DENSITY if density else PlotKinds.LOCATION
+            plot_queue.put(
+                PlotSpec(
+                    kind=kind.value,
+                    data_fp=scatter_fp,
+                    out_fp=out_fp,
+                    column=measure,
+                    corners_fp=corners_fp,
+                )
             )
-            ax.set_aspect("equal")
-        # Setting fig titles and labels
-        g.set_titles(col_template="{col_name}")
-        g.figure.subplots_adjust(top=0.85)
-        g.figure.suptitle("Spatial position", fontsize=12)
-        # Saving fig
-        os.makedirs(os.path.split(out_fp)[0], exist_ok=True)
-        g.savefig(out_fp)
-        g.figure.clf()
+        elif density:
+            PlotMixin.location_density_plot(scatter_df, corners_df, out_fp, measure)
+        else:
+            PlotMixin.location_plot(scatter_df, corners_df, out_fp, measure)
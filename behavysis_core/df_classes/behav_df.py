@@ -4,11 +4,15 @@ Utility functions.
 
 from __future__ import annotations
 
+import os
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
 
 import numpy as np
 import pandas as pd
-from behavysis_pipeline.df_classes.df_mixin import DFMixin, FramesIN
+from behavysis_pipeline.df_classes.df_mixin import Compression, DFMixin, FramesIN
+from behavysis_pipeline.mixins.io_mixin import IOMixin
+from behavysis_pipeline.mixins.misc_mixin import MiscMixin
 
 # TODO: should we combine with BoutsDfMixin?
 
@@ -43,6 +47,11 @@ class BehavDf(DFMixin):
     NULLABLE = False
     IN = FramesIN
     CN = BehavCN
+    DTYPE = np.int8
+    # Classifier probabilities are the only non-integer outcome
+    COLUMN_DTYPES = {BehavColumns.PROB.value: np.float32}
+    # Integer behaviour frames compress well
+    COMPRESSION = Compression.ZSTD.value
 
     @classmethod
     def update_behav(
@@ -68,29 +77,121 @@ class BehavDf(DFMixin):
     ) -> pd.DataFrame:
         """
         Importing Boris TSV file.
+
+        Each event (in file order) sets the behaviour's state from its frame onwards
+        (1 for START, otherwise 0), so each frame has the state of the last event in
+        file order at or before it.
+        The state vectors are built in one sweep: the events are sorted by frame
+        (per behaviour), each is given the state of the last event in file order
+        so far, and the state changes at the event frames are cumulatively summed.
         """
-        # Making df structure
-        df = cls.init_df(np.arange(start_frame, stop_frame))
         # Reading in corresponding BORIS tsv file
-        df_boris = pd.read_csv(fp, sep="\t")
+        df_boris = pd.read_csv(
+            fp, sep="\t", usecols=["Behavior", "Behavior type", "Image index"]
+        )
         # Initialising new classification columns based on
         # BORIS behavs and given `behavs_ls`
         # TODO: how to reconcile this with the behavs_ls?
-        for behav in df_boris["Behavior"].unique():
-            df[(behav, BehavColumns.ACTUAL.value)] = 0
-            df[(behav, BehavColumns.PRED.value)] = 0
-        for behav in behavs_ls:
-            df[(behav, BehavColumns.ACTUAL.value)] = 0
-            df[(behav, BehavColumns.PRED.value)] = 0
+        behavs = list(dict.fromkeys([*df_boris["Behavior"].unique(), *behavs_ls]))
+        n = stop_frame - start_frame
+        # State change (difference) array with a row for changes after the last frame
+        arr = np.zeros((n + 1, len(behavs)), dtype=cls.DTYPE)
         # Setting the classification values from the BORIS file
-        for ind, row in df_boris.iterrows():
-            # Getting corresponding frame of this event point
-            behav = row["Behavior"]
-            frame = row["Image index"]
-            status = row["Behavior type"]
-            # Updating the classification in the scored df
-            df.loc[frame:, (behav, BehavColumns.ACTUAL.value)] = status == "START"
-            df.loc[frame:, (behav, BehavColumns.PRED.value)] = status == "START"
-        # Setting dtype to int8
-        df = df.astype(np.int8)
+        for i, behav in enumerate(behavs):
+            # Getting the frame-sorted events of this behaviour
+            events = df_boris[df_boris["Behavior"] == behav]
+            frames = events["Image index"].to_numpy(dtype=np.int64)
+            states = (events["Behavior type"] == "START").to_numpy(dtype=cls.DTYPE)
+            order = np.argsort(frames, kind="stable")
+            # Getting the state of the last event in file order up to each event
+            frames, states = frames[order], states[np.maximum.accumulate(order)]
+            # Adding each event's state change (i.e. +1 for START and -1 for STOP)
+            changes = np.diff(states, prepend=0)
+            np.add.at(arr[:, i], np.clip(frames - start_frame, 0, n), changes)
+        np.cumsum(arr, axis=0, out=arr)
+        # Making df (actual and pred columns are the same)
+        df = pd.DataFrame(
+            np.repeat(arr[:n], 2, axis=1),
+            index=pd.Index(
+                np.arange(start_frame, stop_frame),
+                name=MiscMixin.enum2tuple(cls.IN)[0],
+            ),
+            columns=pd.MultiIndex.from_tuples(
+                [
+                    (behav, outcome)
+                    for behav in behavs
+                    for outcome in (BehavColumns.ACTUAL.value, BehavColumns.PRED.value)
+                ],
+                names=MiscMixin.enum2tuple(cls.CN),
+            ),
+        )
         return df
+
+    @classmethod
+    def _import_boris_tsv_worker(
+        cls,
+        fp: str,
+        out_fp: None | str,
+        behavs_ls: list[str],
+        start_frame: int,
+        stop_frame: int,
+    ) -> pd.DataFrame | str:
+        """
+        Imports the BORIS TSV file (for `import_boris_tsvs`).
+        Returns the df, or writes it and returns `out_fp` if given.
+        """
+        df = cls.import_boris_tsv(fp, behavs_ls, start_frame, stop_frame)
+        if out_fp is None:
+            return df
+        cls.write_feather(df, out_fp)
+        return out_fp
+
+    @classmethod
+    def import_boris_tsvs(
+        cls,
+        fps: list[str],
+        behavs_ls: list[str],
+        start_frames: int | list[int],
+        stop_frames: int | list[int],
+        out_dir: None | str = None,
+        max_workers: None | int = None,
+    ) -> dict[str, pd.DataFrame | str]:
+        """
+        Importing a list of Boris TSV files in parallel (on a process pool).
+
+        `start_frames` and `stop_frames` are either one for all files or a list
+        with one for each file.
+        If `out_dir` is given, each df is written to `<out_dir>/<name>.feather` in
+        the worker process and its filepath is returned instead of the df.
+
+        Returns a dict of the dfs (or written filepaths) keyed by the file names
+        (`IOMixin.get_name`), in the order of `fps`.
+        """
+        n = len(fps)
+        if not isinstance(start_frames, list):
+            start_frames = [start_frames] * n
+        if not isinstance(stop_frames, list):
+            stop_frames = [stop_frames] * n
+        assert (
+            len(start_frames) == n and len(stop_frames) == n
+        ), "The start_frames and stop_frames must be one value or one for each file."
+        names = [IOMixin.get_name(fp) for fp in fps]
+        out_fps = [
+            os.path.join(out_dir, f"{name}.feather") if out_dir else None
+            for name in names
+        ]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    cls._import_boris_tsv_worker,
+                    fp,
+                    out_fp,
+                    behavs_ls,
+                    start_frame,
+                    stop_frame,
+                )
+                for fp, out_fp, start_frame, stop_frame in zip(
+                    fps, out_fps, start_frames, stop_frames
+                )
+            ]
+            return {name: future.result() for name, future in zip(names, futures)}
@@ -9,7 +9,6 @@ import pandas as pd
 from behavysis_pipeline.df_classes.behav_df import BehavColumns, BehavDf
 from behavysis_pipeline.mixins.misc_mixin import MiscMixin
 from behavysis_pipeline.pydantic_models.bouts import Bouts
-from scipy.stats import mode
 
 ####################################################################################################
 # DF CLASS
@@ -55,36 +54,125 @@ class BoutsDf(BehavDf):
         bouts_df["dur"] = bouts_df["stop"] - bouts_df["start"] + 1
         return bouts_df
 
+    @staticmethod
+    def mat2bouts(mat: np.ndarray | pd.DataFrame) -> pd.DataFrame:
+        """
+        Batched `vect2bouts` for a 2D `(frames, columns)` array.
+        Will return a dataframe with the column index and start and stop indexes of
+        each contiguous set of positive (i.e. non-zero) values (i.e. a bout) in
+        every column, found in one vectorised pass.
+
+        Parameters
+        ----------
+        mat : np.ndarray | pd.DataFrame
+            Expects a 2D array of booleans (or 0/1 ints).
+            If a DataFrame, the start and stop are offset by the first index value.
+
+        Returns
+        -------
+        pd.DataFrame
+            Bouts with `column_id`, `start`, `stop`, and `dur` columns,
+            ordered by `column_id` then `start`.
+        """
+        offset = 0
+        if isinstance(mat, pd.DataFrame):
+            if mat.shape[0] > 0:
+                offset = mat.index[0]
+        # Padding each column with 0 (columns as rows so bouts are column-ordered)
+        z = np.zeros((mat.shape[1], mat.shape[0] + 2), dtype=np.int8)
+        z[:, 1:-1] = (np.asarray(mat) != 0).T
+        z = np.diff(z, axis=1)
+        # Getting stop and start indexes of each bout (ordered the same)
+        column_id, start = np.nonzero(z == 1)
+        _, stop = np.nonzero(z == -1)
+        # Making dataframe
+        bouts_df = pd.DataFrame(
+            {
+                "column_id": column_id,
+                "start": start + offset,
+                "stop": stop - 1 + offset,
+            }
+        )
+        bouts_df["dur"] = bouts_df["stop"] - bouts_df["start"] + 1
+        return bouts_df
+
+    @staticmethod
+    def segments2mode(
+        arr: np.ndarray, starts: np.ndarray, stops: np.ndarray
+    ) -> np.ndarray:
+        """
+        Returns the mode of each segment (i.e. inclusive `start`-`stop` rows)
+        for each column of the 2D `arr`, computed for all segments and columns at once.
+        Ties are broken by the smallest value (as in `scipy.stats.mode`).
+
+        Parameters
+        ----------
+        arr : np.ndarray
+            2D `(frames, columns)` array of (small-range) integer values.
+        starts : np.ndarray
+            Start row position of each segment.
+        stops : np.ndarray
+            Stop row position (inclusive) of each segment.
+
+        Returns
+        -------
+        np.ndarray
+            `(segments, columns)` array of the mode values.
+        """
+        # Getting unique values (sorted, so argmax picks the smallest on ties)
+        values = np.unique(arr)
+        if values.shape[0] == 0:
+            return np.zeros((starts.shape[0], arr.shape[1]), dtype=arr.dtype)
+        counts = np.zeros((values.shape[0], starts.shape[0], arr.shape[1]), np.int64)
+        for i, value in enumerate(values):
+            # Counting value in each segment with a cumulative sum (with leading 0)
+            cumsum = np.zeros((arr.shape[0] + 1, arr.shape[1]), np.int64)
+            np.cumsum(arr == value, axis=0, out=cumsum[1:])
+            counts[i] = cumsum[stops + 1] - cumsum[starts]
+        # Returning the most frequent value in each segment-column
+        return values[np.argmax(counts, axis=0)]
+
     @classmethod
     def frames2bouts(cls, frames_df: pd.DataFrame) -> Bouts:
         """
         Frames df to bouts model object.
         """
         bouts_ls = []
+        # Getting start-stop of each bout of every behaviour
+        behavs = frames_df.columns.unique(BehavDf.CN.BEHAVIOURS.value)
+        pred_df = frames_df.loc[:, [(behav, "pred") for behav in behavs]]
+        all_bouts_df = cls.mat2bouts(pred_df.values)
         # For each behaviour
-        for behav in frames_df.columns.unique(BehavDf.CN.BEHAVIOURS.value):
-            # Getting start-stop of each bout
-            start_stop_df = cls.vect2bouts(frames_df[(behav, "pred")])
+        for i, behav in enumerate(behavs):
+            start_stop_df = all_bouts_df[all_bouts_df["column_id"] == i]
+            starts = start_stop_df["start"].values
+            stops = start_stop_df["stop"].values
+            # Getting the mode value of every bout for actual and specific user_behavs
+            outcomes = [BehavColumns.ACTUAL.value] + [
+                outcome
+                for outcome in frames_df[behav].columns
+                if outcome not in MiscMixin.enum2tuple(BehavColumns)
+            ]
+            modes = cls.segments2mode(
+                frames_df.loc[:, [(behav, j) for j in outcomes]].values, starts, stops
+            )
             # For each bout (i.e. start-stop pair)
-            for _, row in start_stop_df.iterrows():
-                # Getting only the frames in the current bout
-                bout_frames_df = frames_df.loc[row["start"] : row["stop"]]
-                # Preparing to make Bout model object
-                bout_dict = {
-                    "start": row["start"],
-                    "stop": row["stop"],
-                    "behaviour": behav,
-                    "actual": int(
-                        mode(bout_frames_df[(behav, BehavColumns.ACTUAL.value)]).mode
-                    ),
-                    "user_defined": {},
-                }
-                # Getting the mode value for the bout (actual, and specific user_behavs)
-                for outcome, values in bout_frames_df[behav].items():
-                    if outcome not in MiscMixin.enum2tuple(BehavColumns):
-                        bout_dict["user_defined"][str(outcome)] = int(mode(values).mode)
+            for start, stop, bout_modes in zip(
+                frames_df.index[starts], frames_df.index[stops], modes.tolist()
+            ):
                 # Making the Bout model object and appending to bouts_ls
-                bouts_ls.append(bout_dict)
+                bouts_ls.append(
+                    {
+                        "start": start,
+                        "stop": stop,
+                        "behaviour": behav,
+                        "actual": int(bout_modes[0]),
+                        "user_defined": {
+                            str(outcome): int(value)
+                            for outcome, value in zip(outcomes[1:], bout_modes[1:])
+                        },
+                    }
+                )
         # Making and return the Bouts model object
         return Bouts(
             start=frames_df.index[0], stop=frames_df.index[-1] + 1, bouts=bouts_ls
@@ -115,6 +203,8 @@ class BoutsDf(BehavDf):
                 out_df[(behav, i)] = 0
         # Ordering by "behaviours" level
         out_df = out_df.sort_index(axis=1, level=BehavDf.CN.BEHAVIOURS.value)
+        # Setting dtype to int8
+        out_df = cls.cast_dtype(out_df)
         # Returning the new df
         return out_df
 
@@ -122,6 +212,13 @@ class BoutsDf(BehavDf):
     def bouts2frames(cls, bouts: Bouts) -> pd.DataFrame:
         """
         Bouts model object to frames df.
+
+        Each column is filled from columnar bout start/stop/value arrays with a
+        difference array (value added at the start, and subtracted after the stop)
+        and a cumulative sum, in O(frames + bouts).
+        If bouts of the same behaviour overlap (e.g. hand-edited bouts), the frames
+        are instead filled by scattering each bout's values in order, so the last
+        bout wins.
         """
         # Making columns
         all_behavs = {}  # behav: user_behav_ls pairs
@@ -132,24 +229,69 @@ class BoutsDf(BehavDf):
                     BehavColumns.ACTUAL.value,
                 }
             all_behavs[bout.behaviour] |= set(bout.user_defined.keys())
-
-        # construct ret_df with index from given start and stop, and all_behavs dict
-        ret_df = cls.init_df(pd.Series(np.arange(bouts.start, bouts.stop)))
-        for behav, outcomes in all_behavs.items():
-            for outcome in outcomes:
-                ret_df[(behav, outcome)] = 0
-        ret_df = ret_df.sort_index(axis=1)
-        # Filling in all user_behavs columns for each behaviour
+        columns = sorted(
+            (behav, outcome)
+            for behav, outcomes in all_behavs.items()
+            for outcome in outcomes
+        )
+        columns_ids = {column: i for i, column in enumerate(columns)}
+        # Making columnar start, stop, column, and value arrays of every bout's outcomes
+        starts, stops, column_ids, values = [], [], [], []
         for bout in bouts.bouts:
-            bout_ret_df = ret_df.loc[bout.start : bout.stop]
-            # Filling in predicted behaviour column
-            bout_ret_df.loc[:, (bout.behaviour, BehavColumns.PRED.value)] = 1
-            # Filling in actual behaviour column
-            bout_ret_df.loc[:, (bout.behaviour, BehavColumns.ACTUAL.value)] = (
-                bout.actual
-            )
-            # Filling in user_behavs columns
-            for k, v in bout.user_defined.items():
-                bout_ret_df.loc[:, (bout.behaviour, k)] = v
+            bout_values = {
+                BehavColumns.PRED.value: 1,
+                BehavColumns.ACTUAL.value: bout.actual,
+                **bout.user_defined,
+            }
+            for outcome, value in bout_values.items():
+                starts.append(bout.start)
+                stops.append(bout.stop)
+                column_ids.append(columns_ids[(bout.behaviour, outcome)])
+                values.append(value)
+        # Converting to frame positions (clipped to the bouts' start and stop)
+        n = bouts.stop - bouts.start
+        starts = np.clip(np.array(starts, dtype=np.int64) - bouts.start, 0, n)
+        stops = np.clip(np.array(stops, dtype=np.int64) - bouts.start + 1, 0, n)
+        column_ids = np.array(column_ids, dtype=np.int64)
+        values = np.array(values, dtype=cls.DTYPE)
+        arr = np.zeros((n + 1, len(columns)), dtype=cls.DTYPE)
+        if cls._bouts_overlap(starts, stops, column_ids):
+            # Scattering the values of each bout's frames (later bouts overwrite)
+            lengths = np.maximum(stops - starts, 0)
+            offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+            rows = offsets + np.arange(lengths.sum())
+            arr[rows, np.repeat(column_ids, lengths)] = np.repeat(values, lengths)
+        else:
+            # Filling in the difference array and cumulative summing to the frame values
+            np.add.at(arr, (starts, column_ids), values)
+            np.subtract.at(arr, (stops, column_ids), values)
+            np.cumsum(arr, axis=0, out=arr)
+        # construct ret_df with index from given start and stop, and all_behavs dict
+        ret_df = pd.DataFrame(
+            arr[:n],
+            index=pd.Index(
+                np.arange(bouts.start, bouts.stop),
+                name=MiscMixin.enum2tuple(cls.IN)[0],
+            ),
+            columns=pd.MultiIndex.from_tuples(
+                columns, names=MiscMixin.enum2tuple(cls.CN)
+            ),
+            copy=False,
+        )
         # Returning frames df
         return ret_df
+
+    @staticmethod
+    def _bouts_overlap(
+        starts: np.ndarray, stops: np.ndarray, column_ids: np.ndarray
+    ) -> bool:
+        """
+        Returns whether any (non-empty) `[start, stop)` frame ranges of the same
+        column overlap.
+        """
+        keep = stops > starts
+        starts, stops, column_ids = starts[keep], stops[keep], column_ids[keep]
+        order = np.lexsort((starts, column_ids))
+        starts, stops, column_ids = starts[order], stops[order], column_ids[order]
+        same_column = column_ids[1:] == column_ids[:-1]
+        return bool(np.any(same_column & (starts[1:] < stops[:-1])))
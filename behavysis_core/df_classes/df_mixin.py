@@ -4,11 +4,35 @@ Utility functions.
 
 from __future__ import annotations
 
+import ast
+import json
 import os
+import queue
+import re
+import resource
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import contextmanager
 from enum import Enum, EnumType
+from multiprocessing import get_context
+from typing import Callable, Iterable, Iterator
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from behavysis_pipeline.mixins.io_mixin import IOMixin
 from behavysis_pipeline.mixins.misc_mixin import MiscMixin
+from pyarrow import feather
 
 ####################################################################################################
 # DF CONSTANTS
@@ -19,6 +43,16 @@ class FramesIN(Enum):
     FRAME = "frame"
 
 
+class Compression(Enum):
+    UNCOMPRESSED = "uncompressed"
+    LZ4 = "lz4"
+    ZSTD = "zstd"
+
+
+# Key of the behavysis metadata (JSON) in the arrow schema metadata of written files
+META_KEY = b"behavysis"
+
+
 ####################################################################################################
 # DF CLASS
 ####################################################################################################
@@ -30,6 +64,16 @@ class DFMixin:
     NULLABLE = True
     IN = None
     CN = None
+    # dtype of all columns (None is no dtype policy)
+    DTYPE = None
+    # dtypes of the columns whose last column level is the key (overrides DTYPE)
+    COLUMN_DTYPES: dict = {}
+    # Number of frames per feather record batch and parquet row group
+    FRAMES_CHUNKSIZE = 10_000
+    # Compression codec and level (None is the codec's default) of written files.
+    # Note that `mmap` reads of compressed files are not zero-copy.
+    COMPRESSION = Compression.LZ4.value
+    COMPRESSION_LEVEL = None
 
     ###############################################################################################
     # DF Read Functions
@@ -42,6 +86,8 @@ class DFMixin:
         """
         # Reading the file
         df = pd.read_csv(fp, index_col=0)
+        # Casting to the class's dtype
+        df = cls.cast_dtype(df)
         # Sorting by index
         df = df.sort_index()
         # Checking after reading
@@ -50,11 +96,153 @@ class DFMixin:
         return df
 
     @classmethod
-    def read_h5(cls, fp: str) -> pd.DataFrame:
+    def read_h5(
+        cls,
+        fp: str,
+        frames: None | tuple[int, int] = None,
+        where: None | str = None,
+        start: None | int = None,
+        stop: None | int = None,
+        chunksize: None | int = None,
+        **selectors: str | list,
+    ) -> pd.DataFrame | Iterator[pd.DataFrame]:
         """
         Reading dataframe h5 file.
+
+        For table-format h5 files (e.g. written with `cls.write_h5(..., table=True)`
+        or by DLC), the `frames` range (stop exclusive), `where` query
+        (e.g. `"index >= 100"`), and column `selectors` are pushed down to
+        PyTables, so only the matching rows and columns are read.
+        For fixed-format h5 files, `where` is not supported, and `frames` and
+        `selectors` are applied after reading.
+
+        `start` and `stop` are the row positions to read.
+        If `chunksize` is given, returns an iterator of dfs of up to `chunksize` rows.
+        """
+        if chunksize:
+            return cls._iread_h5(fp, frames, where, start, stop, chunksize, selectors)
+        with pd.HDFStore(fp, mode="r") as store:
+            key, is_table = cls._get_h5_key(store)
+            kwargs = cls._get_h5_select_kwargs(
+                store, key, is_table, frames, where, selectors
+            )
+            df = pd.DataFrame(store.select(key, start=start, stop=stop, **kwargs))
+        return cls._post_read_h5(df, is_table, frames, selectors)
+
+    @classmethod
+    def _iread_h5(
+        cls,
+        fp: str,
+        frames: None | tuple[int, int],
+        where: None | str,
+        start: None | int,
+        stop: None | int,
+        chunksize: int,
+        selectors: dict,
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Yields the h5 file's dfs of up to `chunksize` rows (see `cls.read_h5`).
+        """
+        with pd.HDFStore(fp, mode="r") as store:
+            key, is_table = cls._get_h5_key(store)
+            kwargs = cls._get_h5_select_kwargs(
+                store, key, is_table, frames, where, selectors
+            )
+            if is_table:
+                chunks = store.select(
+                    key, start=start, stop=stop, chunksize=chunksize, **kwargs
+                )
+            else:
+                # Fixed-format stores are read by row position windows
+                chunks = cls._iselect_h5_fixed(store, key, start, stop, chunksize)
+            for df in chunks:
+                df = cls._post_read_h5(df, is_table, frames, selectors)
+                # Skipping chunks with no frames in the range
+                if df.shape[0] > 0:
+                    yield df
+
+    @staticmethod
+    def _iselect_h5_fixed(
+        store: pd.HDFStore,
+        key: str,
+        start: None | int,
+        stop: None | int,
+        chunksize: int,
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Yields the fixed-format h5 store's dfs of up to `chunksize` rows.
+        """
+        i = start or 0
+        while stop is None or i < stop:
+            j = i + chunksize if stop is None else min(i + chunksize, stop)
+            df = pd.DataFrame(store.select(key, start=i, stop=j))
+            if df.shape[0] == 0:
+                return
+            yield df
+            i = j
+
+    @staticmethod
+    def _get_h5_key(store: pd.HDFStore) -> tuple[str, bool]:
+        """
+        Returns the key of the h5 store's only df, and whether it is table-format.
+        """
+        keys = store.keys()
+        if len(keys) != 1:
+            raise ValueError(
+                f"Expected the h5 file to have a single key but got {keys}."
+            )
+        return keys[0], store.get_storer(keys[0]).is_table
+
+    @classmethod
+    def _get_h5_select_kwargs(
+        cls,
+        store: pd.HDFStore,
+        key: str,
+        is_table: bool,
+        frames: None | tuple[int, int],
+        where: None | str,
+        selectors: dict,
+    ) -> dict:
+        """
+        Returns the `where` and `columns` select kwargs to push the frames range,
+        query, and column selectors down to the table-format h5 store.
+        """
+        if not is_table:
+            if where:
+                raise ValueError("`where` is only supported for table-format h5 files.")
+            return {}
+        where_ls = [where] if where else []
+        if frames:
+            where_ls += [f"index >= {frames[0]}", f"index < {frames[1]}"]
+        columns = None
+        if selectors:
+            # Reading no rows to get the columns to select from
+            columns_df = pd.DataFrame(store.select(key, stop=0))
+            columns = cls.select_columns(columns_df, **selectors).columns.tolist()
+        return {
+            "where": " & ".join(f"({i})" for i in where_ls) or None,
+            "columns": columns,
+        }
+
+    @classmethod
+    def _post_read_h5(
+        cls,
+        df: pd.DataFrame,
+        is_table: bool,
+        frames: None | tuple[int, int],
+        selectors: dict,
+    ) -> pd.DataFrame:
         """
-        df = pd.DataFrame(pd.read_hdf(fp, mode="r"))
+        Selects the frames and columns (if not pushed down to the store),
+        then casts, sorts, and checks the read h5 df.
+        """
+        # Selecting frames and columns
+        if frames and not is_table:
+            df = cls.select_frames(df, frames)
+        if selectors and not is_table:
+            df = cls.select_columns(df, **selectors)
+        # Casting to the class's dtype
+        df = cls.cast_dtype(df)
         # Sorting by index
         df = df.sort_index()
         # Checking after reading
@@ -63,39 +251,462 @@ class DFMixin:
         return df
 
     @classmethod
-    def read_feather(cls, fp: str) -> pd.DataFrame:
+    def read_feather(
+        cls,
+        fp: str,
+        mmap: bool = False,
+        frames: None | tuple[int, int] = None,
+        **selectors: str | list,
+    ) -> pd.DataFrame:
         """
         Reading dataframe feather file.
+
+        If `mmap` is True, the file is memory-mapped and the numeric columns are kept
+        backed by the mapped buffers (i.e. zero-copy), so only the pages that are
+        touched are loaded and concurrent readers share the OS page cache.
+
+        `selectors` are column level name and value(s) pairs
+        (e.g. `individuals=["mouse1"], bodyparts=["Nose", "TailBase1"]`).
+        Only the selected columns are read and decoded from the file.
+
+        `frames` is the `(start, stop)` frame range (stop exclusive) to read.
+        Only the record batches that overlap this range are read and decoded.
+
+        Notes
+        -----
+        Zero-copy is only possible for uncompressed feather files (e.g. the
+        `KeypointsDf` and `FeaturesDf` default `cls.COMPRESSION`), which are
+        written as a single record batch so a frames window is a slice of it.
+        For compressed files, `mmap` only saves reading the file, and all the
+        columns (not only the selected ones) are decompressed onto the heap.
+        The buffers of a memory-mapped df are read-only, so copy the df
+        before modifying it in place.
         """
-        df = pd.read_feather(fp)
-        # Sorting by index
-        df = df.sort_index()
-        # Checking after reading
-        cls.check_df(df)
-        # Returning
-        return df
+        # Getting the fields to read
+        fields = None
+        if selectors:
+            with pa.memory_map(fp) as f:
+                schema = pa.ipc.open_file(f).schema
+            fields = cls.select_fields(schema, **selectors)
+        # Reading the file
+        if frames:
+            table = cls._read_feather_frames(fp, frames, fields, mmap)
+        elif mmap:
+            # Selecting the fields after reading (reading only some fields copies them)
+            table = feather.read_table(fp, memory_map=True)
+            table = table.select(fields) if fields else table
+        else:
+            table = feather.read_table(fp, columns=fields)
+        # Converting to df (if mmap, not consolidating blocks so numeric
+        # columns are not copied), sorting, and checking
+        return cls._table2df(table, split_blocks=mmap)
 
     @classmethod
-    def read_parquet(cls, fp: str) -> pd.DataFrame:
+    def read_parquet(
+        cls,
+        fp: str,
+        frames: None | tuple[int, int] = None,
+        **selectors: str | list,
+    ) -> pd.DataFrame:
         """
         Reading dataframe parquet file.
+
+        `selectors` are column level name and value(s) pairs
+        (e.g. `behaviours=["fight"]`).
+        Only the selected columns are read and decoded from the file.
+
+        `frames` is the `(start, stop)` frame range (stop exclusive) to read.
+        Row groups whose frame min/max statistics are outside this range are skipped.
         """
-        df = pd.read_parquet(fp)
-        # Sorting by index
-        df = df.sort_index()
-        # Checking after reading
-        cls.check_df(df)
-        # Returning
-        return df
+        schema = pq.read_schema(fp)
+        # Getting the fields to read
+        fields = None
+        if selectors:
+            fields = cls.select_fields(schema, **selectors)
+        # Getting the frames filter (pushed down to the row group statistics)
+        filters = None
+        if frames:
+            index_field = cls._get_index_field(schema)
+            filters = [(index_field, ">=", frames[0]), (index_field, "<", frames[1])]
+        # Reading the file
+        table = pq.read_table(fp, columns=fields, filters=filters)
+        # Converting to df, sorting, and checking
+        return cls._table2df(table)
 
     @classmethod
-    def read(cls, fp: str) -> pd.DataFrame:
+    def read(
+        cls,
+        fp: str,
+        mmap: bool = False,
+        frames: None | tuple[int, int] = None,
+        **selectors: str | list,
+    ) -> pd.DataFrame:
         """
         Default dataframe read method.
 
         `cls.read_feather`
         """
-        return cls.read_feather(fp)
+        return cls.read_feather(fp, mmap=mmap, frames=frames, **selectors)
+
+    @classmethod
+    def iread_many(
+        cls,
+        fps: Iterable[str],
+        max_workers: None | int = None,
+        max_bytes: None | int = None,
+        mmap: bool = False,
+        frames: None | tuple[int, int] = None,
+        **selectors: str | list,
+    ) -> Iterator[tuple[str, pd.DataFrame]]:
+        """
+        Reads the given files concurrently (with `cls.read`) on a thread pool,
+        as arrow decoding releases the GIL.
+        Yields `(fp, df)` pairs as each read completes.
+
+        `max_bytes` caps the decoded bytes of the reads in flight (estimated from
+        the file metadata, see `cls.get_decoded_size`) so memory use stays bounded.
+        At least one read is always in flight.
+        `mmap`, `frames`, and `selectors` are passed to `cls.read`.
+        """
+        fps = list(fps)
+        pending = {}
+        in_flight = 0
+        i = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while i < len(fps) or pending:
+                # Submitting reads while under the bytes cap
+                while i < len(fps):
+                    size = cls.get_decoded_size(fps[i]) if max_bytes else 0
+                    if pending and max_bytes and in_flight + size > max_bytes:
+                        break
+                    future = executor.submit(
+                        cls.read, fps[i], mmap=mmap, frames=frames, **selectors
+                    )
+                    pending[future] = (fps[i], size)
+                    in_flight += size
+                    i += 1
+                # Yielding the completed reads
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    fp, size = pending.pop(future)
+                    in_flight -= size
+                    yield fp, future.result()
+
+    @classmethod
+    def get_decoded_size(cls, fp: str) -> int:
+        """
+        Returns the estimated decoded (i.e. in memory) bytes of the file from its
+        metadata, without reading its data.
+
+        For parquet files, this is the row groups' uncompressed size.
+        For feather files, this is the number of rows (stored in the behavysis
+        metadata, otherwise counted by decoding the first field of each record
+        batch) times the row width of the schema (variable-width fields are
+        counted as their 8 byte offsets).
+        Other files fall back to their size on disk.
+        """
+        if os.path.splitext(fp)[1] == ".parquet":
+            md = pq.read_metadata(fp)
+            return sum(
+                md.row_group(i).total_byte_size for i in range(md.num_row_groups)
+            )
+        try:
+            with pa.memory_map(fp) as f:
+                schema = pa.ipc.open_file(f).schema
+                n_rows = cls._get_meta(schema).get("num_rows")
+                if n_rows is None:
+                    # Only decoding the first field of each record batch
+                    reader = pa.ipc.open_file(
+                        f, options=pa.ipc.IpcReadOptions(included_fields=[0])
+                    )
+                    n_rows = sum(
+                        reader.get_batch(i).num_rows
+                        for i in range(reader.num_record_batches)
+                    )
+        except pa.ArrowInvalid:
+            return os.path.getsize(fp)
+        width = 0
+        for field in schema:
+            try:
+                width += -(-field.type.bit_width // 8)
+            except ValueError:
+                width += 8
+        return n_rows * width
+
+    @classmethod
+    def read_many(
+        cls,
+        fps: Iterable[str],
+        max_workers: None | int = None,
+        max_bytes: None | int = None,
+        mmap: bool = False,
+        frames: None | tuple[int, int] = None,
+        **selectors: str | list,
+    ) -> dict[str, pd.DataFrame]:
+        """
+        Reads the given files concurrently (see `cls.iread_many`).
+
+        Returns a dict of the dfs keyed by the file names (`IOMixin.get_name`),
+        in the order of `fps`.
+        """
+        fps = list(fps)
+        df_dict = dict(
+            cls.iread_many(fps, max_workers, max_bytes, mmap, frames, **selectors)
+        )
+        return {IOMixin.get_name(fp): df_dict[fp] for fp in fps}
+
+    ###############################################################################################
+    # DF Stamp Functions
+    ###############################################################################################
+
+    @classmethod
+    def _make_stamp(cls, df: pd.DataFrame) -> dict:
+        """
+        Returns the stamp of the df, written to the file's metadata.
+        The stamp records the df class, level names, and whether the index is
+        monotonic and there are no nulls, so trusted reads can skip sorting
+        and null checking.
+        """
+        return {
+            "class": cls.__name__,
+            "IN": list(df.index.names),
+            "CN": list(df.columns.names),
+            "index_monotonic": bool(df.index.is_monotonic_increasing),
+            # Non-nullable dfs are already checked before writing (nullable dfs
+            # are not scanned, as their reads do not check nulls)
+            "no_nulls": not cls.NULLABLE,
+        }
+
+    @classmethod
+    def _check_stamp(cls, meta: dict) -> bool:
+        """
+        Returns whether the stamp in the file's metadata matches this df class.
+        """
+        stamp = meta.get("stamp", {})
+        return (
+            stamp.get("class") == cls.__name__
+            and (not cls.IN or stamp.get("IN") == list(MiscMixin.enum2tuple(cls.IN)))
+            and (not cls.CN or stamp.get("CN") == list(MiscMixin.enum2tuple(cls.CN)))
+        )
+
+    @staticmethod
+    def _table_has_nulls(table: pa.Table) -> bool:
+        """
+        Returns whether the arrow table has any null (or NaN) values.
+        Uses the arrow `null_count` of each column, and checks the float columns for
+        NaN values chunk by chunk. Exits early at the first null found.
+        """
+        for col in table.columns:
+            if col.null_count:
+                return True
+            if pa.types.is_floating(col.type):
+                for chunk in col.chunks:
+                    if pc.any(pc.is_nan(chunk)).as_py():
+                        return True
+        return False
+
+    @classmethod
+    def _table2df(cls, table: pa.Table, split_blocks: bool = False) -> pd.DataFrame:
+        """
+        Converts the read arrow table to a df, then sorts and checks the df.
+
+        If the file's stamp matches, the sorting and null checking is skipped
+        where the stamp says they are not needed.
+        Otherwise, the nulls are checked on the arrow table (see `cls._table_has_nulls`).
+        """
+        meta = cls._get_meta(table.schema)
+        trusted = cls._check_stamp(meta)
+        # Checking there are no null values (before converting)
+        if not cls.NULLABLE and not (trusted and meta["stamp"]["no_nulls"]):
+            assert not cls._table_has_nulls(
+                table
+            ), "The dataframe contains null values. Be sure to run interpolate_points first."
+        df = table.to_pandas(split_blocks=split_blocks)
+        # Casting to the class's dtype (only copies if not already the dtype)
+        df = cls.cast_dtype(df)
+        # Sorting by index (sorting always copies, so only if needed)
+        if not (trusted and meta["stamp"]["index_monotonic"]):
+            if not df.index.is_monotonic_increasing:
+                df = df.sort_index()
+        # Checking after reading (nulls already checked)
+        cls.check_df(df, check_nulls=False)
+        # Returning
+        return df
+
+    ###############################################################################################
+    # DF Frame Selection Functions
+    ###############################################################################################
+
+    @staticmethod
+    def _get_index_field(schema: pa.Schema) -> str:
+        """
+        Returns the name of the (first) index field in the schema's pandas metadata.
+        """
+        index_fields = [
+            i for i in schema.pandas_metadata["index_columns"] if isinstance(i, str)
+        ]
+        if not index_fields:
+            raise ValueError("The file has no stored index to select frames by.")
+        return index_fields[0]
+
+    @staticmethod
+    def _get_meta(schema: pa.Schema) -> dict:
+        """
+        Returns the behavysis metadata stored in the schema (empty if none).
+        """
+        meta = (schema.metadata or {}).get(META_KEY)
+        return json.loads(meta) if meta else {}
+
+    @classmethod
+    def _df2table(cls, df: pd.DataFrame, chunksize: None | int = None) -> pa.Table:
+        """
+        Converts the df to an arrow table with the behavysis metadata.
+
+        The metadata includes the stamp of the (already checked) df
+        (see `cls._make_stamp`) and the number of rows.
+        If the df is frame-indexed, the metadata includes the frame index
+        (i.e. the min and max frame of each `chunksize` rows chunk, default is
+        `cls.FRAMES_CHUNKSIZE`), which corresponds to the feather record batches.
+        """
+        chunksize = chunksize or cls.FRAMES_CHUNKSIZE
+        table = pa.Table.from_pandas(df)
+        meta = {"stamp": cls._make_stamp(df), "num_rows": table.num_rows}
+        if cls.IN is FramesIN and df.shape[0] > 0:
+            frames = df.index.get_level_values(FramesIN.FRAME.value).values
+            starts = np.arange(0, frames.shape[0], chunksize)
+            meta["frames_min"] = np.minimum.reduceat(frames, starts).tolist()
+            meta["frames_max"] = np.maximum.reduceat(frames, starts).tolist()
+        return table.replace_schema_metadata(
+            {**table.schema.metadata, META_KEY: json.dumps(meta)}
+        )
+
+    @classmethod
+    def _read_feather_frames(
+        cls,
+        fp: str,
+        frames: tuple[int, int],
+        fields: None | list[str],
+        mmap: bool,
+    ) -> pa.Table:
+        """
+        Reads only the record batches of the feather file that overlap
+        the `(start, stop)` frames range, then filters the rows to the range.
+
+        Uses the stored frame index if it matches the file's record batches.
+        Otherwise, reads only the index field of each batch to find them.
+        The file is always memory-mapped, so for uncompressed files only the
+        pages of the frames range are read (and if not `mmap`, copied).
+        """
+        start, stop = frames
+        with pa.memory_map(fp) as source:
+            reader = pa.ipc.open_file(source)
+            schema = reader.schema
+            index_field = cls._get_index_field(schema)
+            # Getting the min and max frame of each record batch
+            meta = cls._get_meta(schema)
+            if len(meta.get("frames_min", [])) == reader.num_record_batches:
+                frames_min = np.array(meta["frames_min"])
+                frames_max = np.array(meta["frames_max"])
+            else:
+                options = pa.ipc.IpcReadOptions(
+                    included_fields=[schema.get_field_index(index_field)]
+                )
+                index_reader = pa.ipc.open_file(source, options=options)
+                batch_ls = [
+                    index_reader.get_batch(i).column(0)
+                    for i in range(index_reader.num_record_batches)
+                ]
+                frames_min = np.array([pc.min(i).as_py() for i in batch_ls])
+                frames_max = np.array([pc.max(i).as_py() for i in batch_ls])
+            # Reading only the (selected fields of the) overlapping record batches
+            # (if mmap, selecting the fields after reading, as reading only some
+            # fields copies them)
+            batch_ids = np.flatnonzero((frames_max >= start) & (frames_min < stop))
+            fields = fields or schema.names
+            options = pa.ipc.IpcReadOptions(
+                included_fields=None
+                if mmap
+                else [schema.get_field_index(i) for i in fields]
+            )
+            reader = pa.ipc.open_file(source, options=options)
+            table = pa.Table.from_batches(
+                [reader.get_batch(i) for i in batch_ids], schema=reader.schema
+            ).select(fields)
+        # Filtering rows to the frames range (if mmap and the rows are contiguous,
+        # slicing the mapped buffers, i.e. zero-copy)
+        index = table.column(index_field).to_numpy()
+        rows = np.flatnonzero((index >= start) & (index < stop))
+        if mmap and rows.shape[0] and rows[-1] - rows[0] + 1 == rows.shape[0]:
+            return table.slice(rows[0], rows.shape[0])
+        return table.take(rows)
+
+    @classmethod
+    def select_frames(cls, df: pd.DataFrame, frames: tuple[int, int]) -> pd.DataFrame:
+        """
+        Returns the rows of the df in the `(start, stop)` frames range (stop exclusive).
+        """
+        start, stop = frames
+        index = df.index.get_level_values(0)
+        return df.loc[(index >= start) & (index < stop)]
+
+    ###############################################################################################
+    # DF Column Selection Functions
+    ###############################################################################################
+
+    @staticmethod
+    def _selectors2sets(levels: list, selectors: dict) -> dict[str, set]:
+        """
+        Checks that the `selectors` keys are column level names and
+        converts each selector value(s) to a set.
+        """
+        for level in selectors:
+            if level not in levels:
+                raise ValueError(
+                    f"Invalid column level: {level}.\n"
+                    f"Option must be one of: {', '.join(map(str, levels))}"
+                )
+        return {
+            level: {vals} if isinstance(vals, str) else set(vals)
+            for level, vals in selectors.items()
+        }
+
+    @classmethod
+    def select_fields(cls, schema: pa.Schema, **selectors: str | list) -> list[str]:
+        """
+        Returns the names of the arrow fields (i.e. the index fields and the
+        columns matching all `selectors`) to read from a file with the given schema.
+        Used to push column selection down to the arrow readers.
+
+        Expects the schema to have the pandas metadata
+        (i.e. the file was written from a pandas DataFrame).
+        """
+        pd_meta = schema.pandas_metadata
+        levels = [i["name"] for i in pd_meta["column_indexes"]]
+        selectors = cls._selectors2sets(levels, selectors)
+        # Index fields are always read (RangeIndex is stored as metadata, not a field)
+        index_fields = [i for i in pd_meta["index_columns"] if isinstance(i, str)]
+        fields = []
+        for col in pd_meta["columns"]:
+            field = col["field_name"]
+            if field in index_fields:
+                continue
+            # MultiIndex column names are stored as the str of the tuple
+            key = ast.literal_eval(col["name"]) if len(levels) > 1 else (col["name"],)
+            if all(key[levels.index(k)] in v for k, v in selectors.items()):
+                fields.append(field)
+        return index_fields + fields
+
+    @classmethod
+    def select_columns(cls, df: pd.DataFrame, **selectors: str | list) -> pd.DataFrame:
+        """
+        Returns the columns of the df matching all `selectors`
+        (column level name and value(s) pairs).
+        """
+        selectors = cls._selectors2sets(list(df.columns.names), selectors)
+        mask = np.full(df.shape[1], True)
+        for level, vals in selectors.items():
+            mask &= df.columns.get_level_values(level).isin(vals)
+        return df.loc[:, mask]
 
     ###############################################################################################
     # DF Write Functions
@@ -106,49 +717,166 @@ class DFMixin:
         """
         Writing DLC dataframe to csv file.
         """
+        # Casting to the class's dtype
+        df = cls.cast_dtype(df)
         # Checking before writing
         cls.check_df(df)
-        # Making the directory if it doesn't exist
-        os.makedirs(os.path.dirname(fp), exist_ok=True)
-        # Writing the file
-        df.to_csv(fp)
+        # Writing the file (atomically)
+        with cls.atomic_fp(fp) as tmp_fp:
+            df.to_csv(tmp_fp)
 
     @classmethod
-    def write_h5(cls, df: pd.DataFrame, fp: str) -> None:
+    def write_h5(
+        cls,
+        df: pd.DataFrame,
+        fp: str,
+        compression: None | str = None,
+        compression_level: None | int = None,
+        table: bool = False,
+    ) -> None:
         """
         Writing dataframe h5 file.
+
+        The `compression` codec and level default to
+        `cls.COMPRESSION` and `cls.COMPRESSION_LEVEL` (using the blosc compressors).
+
+        If `table` is True, writes in table format with the frame index indexed,
+        so the file can be read by frame range, query, and columns (see `cls.read_h5`).
         """
+        compression, compression_level = cls._get_compression(
+            compression, compression_level
+        )
+        # Casting to the class's dtype
+        df = cls.cast_dtype(df)
         # Checking before writing
         cls.check_df(df)
-        # Making the directory if it doesn't exist
-        os.makedirs(os.path.dirname(fp), exist_ok=True)
-        # Writing the file
+        # Writing the file (atomically)
         DLC_HDF_KEY = "data"
-        df.to_hdf(fp, key=DLC_HDF_KEY, mode="w")
+        h5_format = "table" if table else "fixed"
+        with cls.atomic_fp(fp) as tmp_fp:
+            if compression == Compression.UNCOMPRESSED.value:
+                df.to_hdf(tmp_fp, key=DLC_HDF_KEY, mode="w", format=h5_format)
+            else:
+                df.to_hdf(
+                    tmp_fp,
+                    key=DLC_HDF_KEY,
+                    mode="w",
+                    format=h5_format,
+                    complib=f"blosc:{compression}",
+                    complevel=compression_level or 5,
+                )
 
     @classmethod
-    def write_feather(cls, df: pd.Series | pd.DataFrame, fp: str) -> None:
+    def write_feather(
+        cls,
+        df: pd.Series | pd.DataFrame,
+        fp: str,
+        compression: None | str = None,
+        compression_level: None | int = None,
+    ) -> None:
         """
         Writing dataframe feather file.
+
+        The `compression` codec and level default to
+        `cls.COMPRESSION` and `cls.COMPRESSION_LEVEL`.
         """
+        compression, compression_level = cls._get_compression(
+            compression, compression_level
+        )
+        # Casting to the class's dtype
+        df = cls.cast_dtype(df)
         # Checking before writing
         cls.check_df(df)
-        # Making the directory if it doesn't exist
-        os.makedirs(os.path.dirname(fp), exist_ok=True)
-        # Writing the file
-        df.to_feather(fp)
+        # Writing the file atomically in record batches of `cls.FRAMES_CHUNKSIZE`
+        # frames (uncompressed files are one batch, so mmap reads are zero-copy)
+        chunksize = cls.FRAMES_CHUNKSIZE
+        if compression == Compression.UNCOMPRESSED.value:
+            chunksize = max(df.shape[0], 1)
+        table = cls._df2table(df, chunksize)
+        with cls.atomic_fp(fp) as tmp_fp:
+            feather.write_feather(
+                table,
+                tmp_fp,
+                compression=compression,
+                compression_level=compression_level,
+                chunksize=chunksize,
+            )
 
     @classmethod
-    def write_parquet(cls, df: pd.DataFrame, fp: str) -> None:
+    def write_parquet(
+        cls,
+        df: pd.DataFrame,
+        fp: str,
+        compression: None | str = None,
+        compression_level: None | int = None,
+    ) -> None:
         """
         Writing dataframe feather file.
+
+        The `compression` codec and level default to
+        `cls.COMPRESSION` and `cls.COMPRESSION_LEVEL`.
         """
+        compression, compression_level = cls._get_compression(
+            compression, compression_level
+        )
+        # Casting to the class's dtype
+        df = cls.cast_dtype(df)
         # Checking before writing
         cls.check_df(df)
-        # Making the directory if it doesn't exist
-        os.makedirs(os.path.dirname(fp), exist_ok=True)
-        # Writing the file
-        df.to_parquet(fp)
+        # Writing the file atomically (in row groups of `cls.FRAMES_CHUNKSIZE` frames)
+        table = cls._df2table(df)
+        with cls.atomic_fp(fp) as tmp_fp:
+            pq.write_table(
+                table,
+                tmp_fp,
+                row_group_size=cls.FRAMES_CHUNKSIZE,
+                compression="none"
+                if compression == Compression.UNCOMPRESSED.value
+                else compression,
+                compression_level=compression_level,
+            )
+
+    @staticmethod
+    @contextmanager
+    def atomic_fp(fp: str) -> Iterator[str]:
+        """
+        Context manager that yields a unique temporary filepath (hidden, in the
+        same directory as `fp`) to write to.
+        On exit, the temporary file is atomically renamed to `fp`, so `fp` is never
+        a partially written file. If writing fails, the temporary file is removed.
+
+        The temporary file is made by the writer (not here), so `fp` has the usual
+        umask permissions.
+        Makes the directory if it doesn't exist.
+        """
+        fp_dir = os.path.dirname(fp)
+        os.makedirs(fp_dir, exist_ok=True)
+        tmp_fp = os.path.join(fp_dir, f".{os.path.basename(fp)}.{uuid.uuid4().hex}.tmp")
+        try:
+            yield tmp_fp
+            os.replace(tmp_fp, fp)
+        except BaseException:
+            IOMixin.silent_rm(tmp_fp)
+            raise
+
+    @classmethod
+    def _get_compression(
+        cls, compression: None | str, compression_level: None | int
+    ) -> tuple[str, None | int]:
+        """
+        Returns the given compression codec and level, defaulting to
+        `cls.COMPRESSION` and `cls.COMPRESSION_LEVEL`.
+        Raises a ValueError if the codec is not in `Compression`.
+        """
+        compression = compression or cls.COMPRESSION
+        if compression not in MiscMixin.enum2tuple(Compression):
+            raise ValueError(
+                f"Invalid compression: {compression}.\n"
+                f"Option must be one of: {', '.join(MiscMixin.enum2tuple(Compression))}"
+            )
+        if compression_level is None:
+            compression_level = cls.COMPRESSION_LEVEL
+        return compression, compression_level
 
     @classmethod
     def write(cls, df: pd.DataFrame, fp: str) -> None:
@@ -159,6 +887,114 @@ class DFMixin:
         """
         return cls.write_feather(df, fp)
 
+    ###############################################################################################
+    # DF Benchmark Functions
+    ###############################################################################################
+
+    @staticmethod
+    def _reset_peak_rss() -> int:
+        """
+        Resets the peak resident set size (RSS) of the current process to the
+        current RSS, and returns the current RSS (bytes).
+
+        Only possible on Linux. Elsewhere, the peak RSS is not reset and
+        the current RSS is taken as the peak RSS so far.
+        """
+        try:
+            with open("/proc/self/clear_refs", "w", encoding="utf-8") as f:
+                f.write("5")
+            with open("/proc/self/status", "r", encoding="utf-8") as f:
+                return int(re.search(r"VmRSS:\s+(\d+)", f.read()).group(1)) * 1024
+        except OSError:
+            return DFMixin._get_peak_rss()
+
+    @staticmethod
+    def _get_peak_rss() -> int:
+        """Returns the peak resident set size (bytes) of the current process."""
+        try:
+            with open("/proc/self/status", "r", encoding="utf-8") as f:
+                return int(re.search(r"VmHWM:\s+(\d+)", f.read()).group(1)) * 1024
+        except OSError:
+            peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # ru_maxrss is in kilobytes on Linux and bytes on macOS
+            return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+    @classmethod
+    def _benchmark_write(
+        cls, src_fp: str, fp: str, fmt: str, compression: str, level: None | int
+    ) -> tuple[float, int]:
+        """
+        Writes the df in `src_fp` (pickle) to `fp` in the given format and codec.
+        Returns the write time (sec) and peak RSS increase (bytes) of the write.
+        """
+        df = pd.read_pickle(src_fp)
+        rss = cls._reset_peak_rss()
+        t0 = time.perf_counter()
+        getattr(cls, f"write_{fmt}")(df, fp, compression, level)
+        return time.perf_counter() - t0, cls._get_peak_rss() - rss
+
+    @classmethod
+    def _benchmark_read(cls, fp: str, fmt: str) -> tuple[float, int]:
+        """
+        Reads the df in `fp` in the given format.
+        Returns the read time (sec) and peak RSS increase (bytes) of the read.
+        """
+        rss = cls._reset_peak_rss()
+        t0 = time.perf_counter()
+        getattr(cls, f"read_{fmt}")(fp)
+        return time.perf_counter() - t0, cls._get_peak_rss() - rss
+
+    @classmethod
+    def benchmark_compression(
+        cls,
+        df: pd.DataFrame,
+        out_dir: str,
+        formats: tuple[str, ...] = ("feather", "parquet", "h5"),
+        compressions: tuple[str, ...] = MiscMixin.enum2tuple(Compression),
+        compression_level: None | int = None,
+    ) -> pd.DataFrame:
+        """
+        Benchmarks writing and reading the given (representative) df
+        for each format and compression codec, with the files written to `out_dir`
+        (e.g. a directory on the project's storage).
+
+        Each write and read is run in a fresh process so its peak RSS is measured alone.
+
+        Returns a df of the write time (sec), read time (sec), file size (MB),
+        and write and read peak RSS increase (MB) for each format and codec.
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        src_fp = os.path.join(out_dir, "benchmark_src.pkl")
+        df.to_pickle(src_fp)
+        results = {}
+        for fmt in formats:
+            for compression in compressions:
+                fp = os.path.join(out_dir, f"benchmark_{compression}.{fmt}")
+                # Running each in a fresh process
+                with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as p:
+                    write_sec, write_rss = p.submit(
+                        cls._benchmark_write,
+                        src_fp,
+                        fp,
+                        fmt,
+                        compression,
+                        compression_level,
+                    ).result()
+                with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as p:
+                    read_sec, read_rss = p.submit(cls._benchmark_read, fp, fmt).result()
+                results[(fmt, compression)] = {
+                    "write_sec": write_sec,
+                    "read_sec": read_sec,
+                    "size_mb": os.path.getsize(fp) / 2**20,
+                    "write_peak_rss_mb": write_rss / 2**20,
+                    "read_peak_rss_mb": read_rss / 2**20,
+                }
+                os.remove(fp)
+        os.remove(src_fp)
+        results_df = pd.DataFrame.from_dict(results, orient="index")
+        results_df.index.names = ["format", "compression"]
+        return results_df
+
     ###############################################################################################
     # DF init functions
     ###############################################################################################
@@ -186,20 +1022,44 @@ class DFMixin:
         return pd.DataFrame(
             index=pd.Index(frame_vect, name=MiscMixin.enum2tuple(IN)[0]),
             columns=pd.MultiIndex.from_tuples((), names=MiscMixin.enum2tuple(CN)),
+            dtype=cls.DTYPE,
+        )
+
+    @classmethod
+    def cast_dtype(cls, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Casts the columns of the df to `cls.DTYPE`, or to the `cls.COLUMN_DTYPES`
+        dtype of their last column level value (e.g. a float "prob" outcome).
+        Returns the df itself if there is no dtype policy or it is already the dtypes.
+        """
+        if cls.DTYPE is None:
+            return df
+        # Getting the dtype of each column
+        dtypes = pd.Series(
+            [
+                np.dtype(cls.COLUMN_DTYPES.get(i, cls.DTYPE))
+                for i in df.columns.get_level_values(-1)
+            ],
+            index=df.columns,
         )
+        if (df.dtypes == dtypes).all():
+            return df
+        return df.astype(dtypes.to_dict())
 
     ###############################################################################################
     # DF Check functions
     ###############################################################################################
 
     @classmethod
-    def check_df(cls, df: pd.DataFrame) -> None:
+    def check_df(cls, df: pd.DataFrame, check_nulls: bool = True) -> None:
         """__summary__"""
         # Checking that df is a DataFrame
         assert isinstance(df, pd.DataFrame), "The dataframe is not a pandas DataFrame."
         # Checking there are no null values
-        if not cls.NULLABLE:
-            assert not df.isnull().values.any(), "The dataframe contains null values. Be sure to run interpolate_points first."
+        if not cls.NULLABLE and check_nulls:
+            assert not cls.has_nulls(
+                df
+            ), "The dataframe contains null values. Be sure to run interpolate_points first."
         # Checking that the index levels are correct
         if cls.IN:
             cls.check_IN(df, cls.IN)
@@ -207,6 +1067,18 @@ class DFMixin:
         if cls.CN:
             cls.check_CN(df, cls.CN)
 
+    @classmethod
+    def has_nulls(cls, df: pd.DataFrame) -> bool:
+        """
+        Returns whether the df has any null values.
+        Checks in chunks of `cls.FRAMES_CHUNKSIZE` rows (so the null mask is
+        never as large as the df) and exits early at the first null found.
+        """
+        for i in range(0, df.shape[0], cls.FRAMES_CHUNKSIZE):
+            if df.iloc[i : i + cls.FRAMES_CHUNKSIZE].isnull().values.any():
+                return True
+        return False
+
     @staticmethod
     def check_IN(df: pd.DataFrame, levels: EnumType | tuple[str] | str) -> None:
         """__summary__"""
@@ -230,3 +1102,100 @@ class DFMixin:
         assert (
             df.columns.names == levels
         ), f"The column level is incorrect. Expected {levels} but got {df.columns.names}."
+
+
+####################################################################################################
+# DF BACKGROUND WRITER
+####################################################################################################
+
+
+class DFWriter:
+    """
+    Writes dfs on background threads, so the producing step keeps computing
+    while earlier outputs are written.
+
+    Writes are put on a bounded queue (`put` blocks when it is full).
+    Write errors are collected and raised by `flush` (and on exiting the context).
+    If the context exits with an error, the write errors are added to its notes
+    instead.
+
+    Example
+    -------
+    ```
+    with DFWriter() as writer:
+        writer.put(AnalyseBinnedDf.write, binned_df, binned_fp)
+    ```
+    """
+
+    def __init__(self, max_queue: int = 8, n_workers: int = 1):
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._errors = []
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._run, daemon=True) for _ in range(n_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self) -> None:
+        """Worker thread loop. Writes each queued df until the `None` sentinel."""
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                write_func, df, fp, kwargs = item
+                write_func(df, fp, **kwargs)
+            except Exception as e:
+                with self._lock:
+                    self._errors.append((fp, e))
+            finally:
+                self._queue.task_done()
+
+    def put(
+        self, write_func: Callable[..., None], df: pd.DataFrame, fp: str, **kwargs
+    ) -> None:
+        """
+        Queues writing the df to `fp` with the given write function
+        (e.g. `KeypointsDf.write`). Blocks while the queue is full.
+
+        The df must not be modified until it is written (i.e. after `flush`).
+        """
+        self._queue.put((write_func, df, fp, kwargs))
+
+    def flush(self) -> None:
+        """
+        Waits for all queued writes to finish.
+        Raises a ValueError listing the files that failed to write (if any).
+        """
+        self._queue.join()
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            msg = "Some files failed to write.\nThey are:\n"
+            for fp, e in errors:
+                msg += f"    - {fp}: {e}\n"
+            raise ValueError(msg) from errors[0][1]
+
+    def close(self) -> None:
+        """Flushes the queued writes and stops the worker threads."""
+        try:
+            self.flush()
+        finally:
+            for _ in self._threads:
+                self._queue.put(None)
+            for thread in self._threads:
+                thread.join()
+
+    def __enter__(self) -> DFWriter:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+            return
+        # Not replacing the error raised in the context with the write errors
+        try:
+            self.close()
+        except ValueError as e:
+            exc_value.add_note(str(e))
@@ -6,7 +6,7 @@ from __future__ import annotations
 
 from enum import Enum
 
-from behavysis_pipeline.df_classes.df_mixin import DFMixin, FramesIN
+from behavysis_pipeline.df_classes.df_mixin import Compression, DFMixin, FramesIN
 
 ####################################################################################################
 # DF CONSTANTS
@@ -32,3 +32,6 @@ class FeaturesDf(DFMixin):
     NULLABLE = False
     IN = FramesIN
     CN = FeaturesCN
+    # Float features compress poorly, so keeping them uncompressed
+    # (so `mmap` reads are zero-copy and share the OS page cache)
+    COMPRESSION = Compression.UNCOMPRESSED.value
@@ -4,11 +4,19 @@ Utility functions.
 
 from __future__ import annotations
 
+import csv
+import json
+import os
+import re
 from enum import Enum
 
 import numpy as np
 import pandas as pd
-from behavysis_pipeline.df_classes.df_mixin import DFMixin, FramesIN
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from behavysis_pipeline.df_classes.df_mixin import Compression, DFMixin, FramesIN
+from behavysis_pipeline.mixins.misc_mixin import MiscMixin
 
 ####################################################################################################
 # DF CONSTANTS
@@ -48,6 +56,134 @@ class KeypointsDf(DFMixin):
     NULLABLE = False
     IN = FramesIN
     CN = KeypointsCN
+    DTYPE = np.float32
+    # Float keypoints compress poorly, so keeping them uncompressed
+    # (so `mmap` reads are zero-copy and share the OS page cache)
+    COMPRESSION = Compression.UNCOMPRESSED.value
+    # Bytes of csv body parsed per record batch when converting DLC csv files
+    CSV_BLOCK_SIZE = 16 * 2**20
+
+    @classmethod
+    def write_npy_store(cls, df: pd.DataFrame, store_dir: str) -> None:
+        """
+        Writing keypoints df to a chunked npy store (see `KeypointsStore`).
+        """
+        # Casting to the class's dtype
+        df = cls.cast_dtype(df)
+        # Checking before writing
+        cls.check_df(df)
+        # Writing the store
+        KeypointsStore.create(KeypointsArray.from_df(df), store_dir)
+
+    @classmethod
+    def read_npy_store(
+        cls,
+        store_dir: str,
+        frames: None | tuple[int, int] = None,
+        **selectors: str | list,
+    ) -> pd.DataFrame:
+        """
+        Reading keypoints df from a chunked npy store (see `KeypointsStore.read`).
+        `selectors` are the individuals, bodyparts, and/or coords to read.
+        """
+        return KeypointsStore(store_dir).read(frames, **selectors).to_df()
+
+    @classmethod
+    def read_dlc_csv_header(cls, fp: str) -> tuple[pd.MultiIndex, int]:
+        """
+        Reads the header rows of a DLC csv file.
+
+        Returns the `KeypointsCN` columns MultiIndex and the number of header rows.
+        Single-animal DLC files (i.e. without the "individuals" row)
+        are given the "single" individual.
+        """
+        levels = MiscMixin.enum2tuple(cls.CN)
+        header = {}
+        n_rows = 0
+        with open(fp, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            for row in reader:
+                n_rows += 1
+                header[row[0]] = row[1:]
+                if row[0] == cls.CN.COORDS.value:
+                    break
+            # Csv files written by pandas have an extra row with the index name
+            row = next(reader, None)
+            if row and not row[0].lstrip("-").isdigit():
+                n_rows += 1
+        n_cols = len(header[cls.CN.COORDS.value])
+        header.setdefault(
+            cls.CN.INDIVIDUALS.value, [IndivColumns.SINGLE.value] * n_cols
+        )
+        columns = pd.MultiIndex.from_arrays([header[i] for i in levels], names=levels)
+        return columns, n_rows
+
+    @classmethod
+    def convert_dlc_csv(cls, in_fp: str, out_fp: str) -> None:
+        """
+        Converts a DLC csv file to a feather or parquet file (by `out_fp` extension)
+        with the `KeypointsCN` column levels and `cls.DTYPE` values.
+
+        The csv body is streamed in blocks of `cls.CSV_BLOCK_SIZE` bytes, each
+        parsed straight to an arrow record batch and written, so peak memory is
+        bounded regardless of the recording's length.
+
+        Notes
+        -----
+        The converted file has no frame index or stamp (these need the whole df),
+        so reading it falls back to scanning the index and checking nulls with arrow.
+        """
+        columns, n_rows = cls.read_dlc_csv_header(in_fp)
+        # Making the output schema (with pandas metadata) from an empty df
+        template_df = pd.DataFrame(
+            np.zeros((0, columns.shape[0]), dtype=cls.DTYPE),
+            index=pd.Index([], dtype=np.int64, name=FramesIN.FRAME.value),
+            columns=columns,
+        )
+        schema = pa.Schema.from_pandas(template_df, preserve_index=True)
+        # Opening the csv body stream (the first column is the frame)
+        names = [str(i) for i in range(columns.shape[0] + 1)]
+        csv_reader = pacsv.open_csv(
+            in_fp,
+            read_options=pacsv.ReadOptions(
+                skip_rows=n_rows, column_names=names, block_size=cls.CSV_BLOCK_SIZE
+            ),
+            convert_options=pacsv.ConvertOptions(
+                column_types={
+                    i: pa.int64() if i == names[0] else pa.from_numpy_dtype(cls.DTYPE)
+                    for i in names
+                }
+            ),
+        )
+        # Writing each parsed batch (index field is last in the schema) to a temp
+        # file that is renamed to out_fp when done
+        compression, compression_level = cls._get_compression(None, None)
+        with cls.atomic_fp(out_fp) as tmp_fp:
+            if os.path.splitext(out_fp)[1] == ".parquet":
+                writer = pq.ParquetWriter(
+                    tmp_fp,
+                    schema,
+                    compression="none"
+                    if compression == Compression.UNCOMPRESSED.value
+                    else compression,
+                    compression_level=compression_level,
+                )
+            else:
+                writer = pa.ipc.new_file(
+                    tmp_fp,
+                    schema,
+                    options=pa.ipc.IpcWriteOptions(
+                        compression=None
+                        if compression == Compression.UNCOMPRESSED.value
+                        else pa.Codec(compression, compression_level)
+                    ),
+                )
+            with writer:
+                for batch in csv_reader:
+                    arrays = batch.columns[1:] + batch.columns[:1]
+                    writer.write_batch(
+                        pa.RecordBatch.from_arrays(arrays, schema=schema)
+                    )
 
     @staticmethod
     def check_bpts_exist(df: pd.DataFrame, bodyparts: list) -> None:
@@ -140,3 +276,281 @@ class KeypointsDf(DFMixin):
         # Grouping the columns by the individuals level for cleaner presentation
         df = df.sort_index(axis=1)
         return df
+
+
+####################################################################################################
+# ARRAY CLASS
+####################################################################################################
+
+
+class KeypointsArray:
+    """
+    Dense array representation of a keypoints df.
+
+    `data` is a contiguous `(frames, individuals, bodyparts, coords)` array of
+    `KeypointsDf.DTYPE`, so vectorised code can index by axis instead of by
+    column tuple. The labels of each axis are stored in `frames`, `individuals`,
+    `bodyparts`, and `coords`.
+    """
+
+    __slots__ = ("data", "frames", "scorer", "individuals", "bodyparts", "coords")
+
+    def __init__(
+        self,
+        data: np.ndarray,
+        frames: np.ndarray,
+        individuals: np.ndarray,
+        bodyparts: np.ndarray,
+        coords: np.ndarray,
+        scorer: str = "",
+    ):
+        self.data = data
+        self.frames = np.asarray(frames)
+        self.individuals = np.asarray(individuals)
+        self.bodyparts = np.asarray(bodyparts)
+        self.coords = np.asarray(coords)
+        self.scorer = scorer
+        shape = (
+            self.frames.shape[0],
+            self.individuals.shape[0],
+            self.bodyparts.shape[0],
+            self.coords.shape[0],
+        )
+        assert (
+            data.shape == shape
+        ), f"The data shape is incorrect. Expected {shape} but got {data.shape}."
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame) -> KeypointsArray:
+        """
+        Makes the keypoints array from the keypoints df.
+
+        The df's values are not copied if they are already a single row-major block
+        in `(individuals, bodyparts, coords)` column order of `KeypointsDf.DTYPE`
+        (e.g. a df made by `to_df`).
+        Individual-bodypart-coord combinations missing from the df are NaN.
+        """
+        KeypointsDf.check_df(df)
+        CN = KeypointsDf.CN
+        scorers = df.columns.unique(CN.SCORER.value)
+        assert scorers.shape[0] <= 1, f"Expected a single scorer but got {scorers}."
+        individuals = df.columns.unique(CN.INDIVIDUALS.value).values
+        bodyparts = df.columns.unique(CN.BODYPARTS.value).values
+        coords = df.columns.unique(CN.COORDS.value).values
+        # Ordering columns as the (individuals, bodyparts, coords) product
+        columns = pd.MultiIndex.from_product(
+            [scorers, individuals, bodyparts, coords],
+            names=MiscMixin.enum2tuple(CN),
+        )
+        if not df.columns.equals(columns):
+            df = df.reindex(columns=columns)
+        # Reshaping is a view where the values are C-contiguous
+        data = df.to_numpy(dtype=KeypointsDf.DTYPE).reshape(
+            df.shape[0], individuals.shape[0], bodyparts.shape[0], coords.shape[0]
+        )
+        return cls(
+            data=np.ascontiguousarray(data),
+            frames=df.index.values,
+            individuals=individuals,
+            bodyparts=bodyparts,
+            coords=coords,
+            scorer=scorers[0] if scorers.shape[0] else "",
+        )
+
+    def to_df(self) -> pd.DataFrame:
+        """
+        Makes the keypoints df from the keypoints array.
+        The df is backed by `data` (i.e. not copied).
+        """
+        columns = pd.MultiIndex.from_product(
+            [[self.scorer], self.individuals, self.bodyparts, self.coords],
+            names=MiscMixin.enum2tuple(KeypointsDf.CN),
+        )
+        return pd.DataFrame(
+            self.data.reshape(self.data.shape[0], -1),
+            index=pd.Index(self.frames, name=FramesIN.FRAME.value),
+            columns=columns,
+            copy=False,
+        )
+
+    def get_indexes(self, level: str, labels: str | list[str]) -> np.ndarray:
+        """
+        Returns the indexes along the given level's axis
+        (e.g. `get_indexes("bodyparts", ["Nose", "TailBase1"])`).
+        Raises a ValueError if any label is missing.
+        """
+        return self.labels2indexes(getattr(self, level), labels, level)
+
+    @staticmethod
+    def labels2indexes(
+        axis_labels: np.ndarray, labels: str | list[str], level: str
+    ) -> np.ndarray:
+        """
+        Returns the indexes of the `labels` in the `axis_labels` of the given level.
+        Raises a ValueError if any label is missing.
+        """
+        labels = np.atleast_1d(labels)
+        exists = np.isin(labels, axis_labels)
+        if not exists.all():
+            raise ValueError(
+                f"Some {level} are missing from the keypoints array.\n"
+                f"They are: {', '.join(map(str, labels[~exists]))}"
+            )
+        return np.array([np.flatnonzero(axis_labels == i)[0] for i in labels])
+
+
+####################################################################################################
+# ARRAY STORE CLASS
+####################################################################################################
+
+
+class KeypointsStore:
+    """
+    Chunked on-disk store of a keypoints array, for recordings that do not fit in RAM.
+
+    The `(frames, individuals, bodyparts, coords)` data is stored in `.npy` chunks
+    (with each chunk's frames in a separate `.npy` file) that are memory-mapped
+    when read, so reading a frames window or single bodypart trajectory only
+    loads that slice.
+    The labels and each chunk's frame range are stored in a JSON sidecar.
+    ```
+    <store_dir>/
+        meta.json
+        00000_data.npy
+        00000_frames.npy
+        ...
+    ```
+    """
+
+    META_FP = "meta.json"
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, self.META_FP), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+    @classmethod
+    def create(cls, karr: KeypointsArray, store_dir: str) -> KeypointsStore:
+        """
+        Makes a new store with the labels of the given keypoints array,
+        and writes the array as the first chunk(s).
+        Overwrites any existing store in `store_dir` (removing its chunk files).
+        """
+        os.makedirs(store_dir, exist_ok=True)
+        meta = {
+            "scorer": str(karr.scorer),
+            "individuals": karr.individuals.tolist(),
+            "bodyparts": karr.bodyparts.tolist(),
+            "coords": karr.coords.tolist(),
+            "frames_min": [],
+            "frames_max": [],
+        }
+        cls._write_json(meta, os.path.join(store_dir, cls.META_FP))
+        # Removing the chunk files of any previous store (after emptying the sidecar)
+        for fp in os.listdir(store_dir):
+            if re.fullmatch(r"\d{5}_(data|frames)\.npy", fp):
+                os.remove(os.path.join(store_dir, fp))
+        store = cls(store_dir)
+        store.append(karr)
+        return store
+
+    @staticmethod
+    def _write_json(obj: dict, fp: str) -> None:
+        """Writes the object to the JSON file atomically."""
+        with DFMixin.atomic_fp(fp) as tmp_fp:
+            with open(tmp_fp, "w", encoding="utf-8") as f:
+                json.dump(obj, f)
+
+    @staticmethod
+    def _write_npy(arr: np.ndarray, fp: str) -> None:
+        """Writes the array to the npy file atomically."""
+        with DFMixin.atomic_fp(fp) as tmp_fp:
+            with open(tmp_fp, "wb") as f:
+                np.save(f, arr)
+
+    def _chunk_fps(self, i: int) -> tuple[str, str]:
+        """Returns the data and frames filepaths of the i-th chunk."""
+        return (
+            os.path.join(self.store_dir, f"{i:05d}_data.npy"),
+            os.path.join(self.store_dir, f"{i:05d}_frames.npy"),
+        )
+
+    def append(
+        self, karr: KeypointsArray, chunksize: int = KeypointsDf.FRAMES_CHUNKSIZE
+    ) -> None:
+        """
+        Appends the keypoints array to the store in chunks of `chunksize` frames.
+        The array's labels must match the store's labels.
+        """
+        for level in ("individuals", "bodyparts", "coords"):
+            assert (
+                getattr(karr, level).tolist() == self.meta[level]
+            ), f"The {level} of the keypoints array do not match the store."
+        for start in range(0, karr.frames.shape[0], chunksize):
+            i = len(self.meta["frames_min"])
+            frames = karr.frames[start : start + chunksize]
+            data_fp, frames_fp = self._chunk_fps(i)
+            self._write_npy(karr.data[start : start + chunksize], data_fp)
+            self._write_npy(frames, frames_fp)
+            self.meta["frames_min"].append(int(frames.min()))
+            self.meta["frames_max"].append(int(frames.max()))
+        # Updating the sidecar after the chunks are written
+        self._write_json(self.meta, os.path.join(self.store_dir, self.META_FP))
+
+    def read(
+        self,
+        frames: None | tuple[int, int] = None,
+        individuals: None | str | list[str] = None,
+        bodyparts: None | str | list[str] = None,
+        coords: None | str | list[str] = None,
+    ) -> KeypointsArray:
+        """
+        Reads the `(start, stop)` frames range (stop exclusive) and the selected
+        labels of each level (default is all) from the store.
+        Only the chunks overlapping the frames range are memory-mapped, and only
+        the selected slice of them is loaded.
+        """
+        # Getting the overlapping chunks
+        frames_min = np.array(self.meta["frames_min"])
+        frames_max = np.array(self.meta["frames_max"])
+        if frames:
+            start, stop = frames
+            chunk_ids = np.flatnonzero((frames_max >= start) & (frames_min < stop))
+        else:
+            chunk_ids = np.arange(frames_min.shape[0])
+        # Getting the selected indexes of each level
+        selectors = {
+            "individuals": individuals,
+            "bodyparts": bodyparts,
+            "coords": coords,
+        }
+        idx = {
+            level: np.arange(len(self.meta[level]))
+            if sel is None
+            else KeypointsArray.labels2indexes(np.array(self.meta[level]), sel, level)
+            for level, sel in selectors.items()
+        }
+        # Reading the selected slice of each chunk
+        data_ls = [
+            np.zeros(
+                (0, *(idx[level].shape[0] for level in selectors)),
+                dtype=KeypointsDf.DTYPE,
+            )
+        ]
+        frames_ls = [np.zeros(0, dtype=np.int64)]
+        for i in chunk_ids:
+            data_fp, frames_fp = self._chunk_fps(i)
+            chunk_frames = np.load(frames_fp)
+            rows = np.arange(chunk_frames.shape[0])
+            if frames:
+                rows = np.flatnonzero((chunk_frames >= start) & (chunk_frames < stop))
+            data = np.load(data_fp, mmap_mode="r")
+            # Indexing all axes in one step, so only the selected values are read
+            data_ls.append(data[np.ix_(rows, *(idx[level] for level in selectors))])
+            frames_ls.append(chunk_frames[rows])
+        return KeypointsArray(
+            data=np.concatenate(data_ls),
+            frames=np.concatenate(frames_ls),
+            scorer=self.meta["scorer"],
+            **{level: np.array(self.meta[level])[idx[level]] for level in selectors},
+        )
@@ -0,0 +1,408 @@
+"""
+Utility functions.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+from multiprocessing import get_context
+
+import matplotlib
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from behavysis_pipeline.constants import PLOTS_ENABLED
+from behavysis_pipeline.df_classes.keypoints_df import Coords
+from behavysis_pipeline.pydantic_models.plot_spec import PlotSpec
+from matplotlib.figure import Figure
+
+####################################################################################################
+# PLOT CONSTANTS
+####################################################################################################
+
+
+class PlotKinds(Enum):
+    BINNED = "binned"
+    LOCATION = "location"
+    LOCATION_DENSITY = "location_density"
+
+
+####################################################################################################
+# PLOT MIXIN CLASS
+####################################################################################################
+
+
+class PlotMixin:
+    """
+    Plot rendering functions.
+
+    Plots are drawn on a `matplotlib.figure.Figure` (i.e. headless, without pyplot),
+    which can be given to reuse the same figure for many plots.
+    No plots are made if plotting is disabled (`PLOTS_ENABLED`).
+    """
+
+    @staticmethod
+    def _save_fig(fig: Figure, out_fp: str) -> None:
+        """Saves the figure to the file and clears it for reuse."""
+        os.makedirs(os.path.split(out_fp)[0], exist_ok=True)
+        fig.savefig(out_fp)
+        fig.clf()
+
+    @staticmethod
+    def binned_plot(
+        binned_df: pd.DataFrame,
+        out_fp: str,
+        agg_column: str,
+        fig: None | Figure = None,
+    ) -> None:
+        """
+        Line plot of the `agg_column` of each measure over the bins,
+        with a subplot for each individual.
+        """
+        if not PLOTS_ENABLED:
+            return
+        # Making binned_df long
+        binned_stacked_df = (
+            binned_df.stack(binned_df.columns.names[:-1], future_stack=True)[agg_column]
+            .rename("value")
+            .reset_index()
+        )
+        x = binned_df.index.name
+        binned_stacked_df[x] = binned_stacked_df[x].astype(np.float64)
+        individuals = binned_stacked_df["individuals"].unique()
+        # Plotting line graph (a subplot for each individual)
+        fig = fig or Figure()
+        fig.clf()
+        fig.set_size_inches(4 * 1.5 * individuals.shape[0], 4)
+        axes = fig.subplots(1, individuals.shape[0], squeeze=False, sharey=True)[0]
+        for i, (ax, indiv) in enumerate(zip(axes, individuals)):
+            sns.lineplot(
+                data=binned_stacked_df[binned_stacked_df["individuals"] == indiv],
+                x=x,
+                y="value",
+                hue="measures",
+                alpha=0.5,
+                marker="X",
+                markersize=10,
+                legend=i == individuals.shape[0] - 1,
+                ax=ax,
+            )
+            ax.set_title(indiv)
+        # Setting fig titles and labels
+        fig.subplots_adjust(top=0.85)
+        fig.suptitle("Binned data", fontsize=12)
+        # Saving fig
+        PlotMixin._save_fig(fig, out_fp)
+
+    @staticmethod
+    def _location_axes(
+        scatter_df: pd.DataFrame, corners_df: pd.DataFrame, fig: Figure
+    ) -> tuple[pd.DataFrame, pd.DataFrame, np.ndarray, np.ndarray]:
+        """
+        Makes the long (stacked by individual) scatter df, the closed ROI corners df,
+        and the (figure) axes grid of a subplot for each individual.
+        """
+        scatter_stacked_df = scatter_df.stack(
+            level="individuals", future_stack=True
+        ).reset_index("individuals")
+        individuals = scatter_stacked_df["individuals"].unique()
+        # Closing each region definition (from roi_df)
+        corners_df = pd.concat(
+            [corners_df, corners_df.groupby("roi").first().reset_index()],
+            ignore_index=True,
+        )
+        # Making a subplot for each individual, wrapped at 2 columns
+        fig.clf()
+        ncols = min(individuals.shape[0], 2)
+        nrows = int(np.ceil(individuals.shape[0] / 2))
+        width = 8 * 0.5 * individuals.shape[0]
+        fig.set_size_inches(width * ncols, 8 * nrows)
+        axes = fig.subplots(nrows, ncols, squeeze=False, sharex=True, sharey=True)
+        for ax in axes.flat[individuals.shape[0] :]:
+            ax.remove()
+        return scatter_stacked_df, corners_df, individuals, axes
+
+    @staticmethod
+    def _roi_overlay(corners_df: pd.DataFrame, ax) -> None:
+        """Adds the (closed) region definitions (from roi_df) to the plot."""
+        sns.lineplot(
+            data=corners_df,
+            x=Coords.X.value,
+            y=Coords.Y.value,
+            hue="roi",
+            linewidth=1,
+            marker="+",
+            markeredgecolor=(1, 0, 0),
+            markeredgewidth=2,
+            markersize=5,
+            estimator=None,
+            sort=False,
+            legend=False,
+            ax=ax,
+        )
+
+    @staticmethod
+    def location_plot(
+        scatter_df: pd.DataFrame,
+        corners_df: pd.DataFrame,
+        out_fp: str,
+        measure: str,
+        fig: None | Figure = None,
+    ) -> None:
+        """
+        Scatter plot of the location of each individual (coloured by `measure`),
+        with the ROI regions (from `corners_df`) overlaid.
+
+        Expects scatter_df index levels to be (frame,),
+        and column levels to be (individual, measure).
+        """
+        if not PLOTS_ENABLED:
+            return
+        fig = fig or Figure()
+        scatter_stacked_df, corners_df, individuals, axes = PlotMixin._location_axes(
+            scatter_df, corners_df, fig
+        )
+        for ax, indiv in zip(axes.flat, individuals):
+            sns.scatterplot(
+                data=scatter_stacked_df[scatter_stacked_df["individuals"] == indiv],
+                x=Coords.X.value,
+                y=Coords.Y.value,
+                hue=measure,
+                alpha=0.8,
+                linewidth=0,
+                marker=".",
+                s=10,
+                ax=ax,
+            )
+            PlotMixin._roi_overlay(corners_df, ax)
+            ax.set_aspect("equal")
+            ax.set_title(indiv)
+        # Invert the y axis
+        axes.flat[0].invert_yaxis()
+        # Setting fig titles and labels
+        fig.subplots_adjust(top=0.85)
+        fig.suptitle("Spatial position", fontsize=12)
+        # Saving fig
+        PlotMixin._save_fig(fig, out_fp)
+
+    @staticmethod
+    def location_density_plot(
+        scatter_df: pd.DataFrame,
+        corners_df: pd.DataFrame,
+        out_fp: str,
+        measure: str,
+        fig: None | Figure = None,
+        bins: int = 256,
+        max_categories: int = 20,
+    ) -> None:
+        """
+        Rasterised density plot of the location of each individual,
+        with the ROI regions (from `corners_df`) overlaid.
+
+        Each individual's x-y locations are binned into a 2D histogram
+        (`bins` x `bins`) for each `measure` category, and drawn as an image
+        (coloured by category, with opacity by log count), so the render time does
+        not depend on the number of frames.
+        As one image is drawn per category, `measure` must be categorical, with up
+        to `max_categories` categories (otherwise raises a ValueError).
+
+        Expects scatter_df index levels to be (frame,),
+        and column levels to be (individual, measure).
+        """
+        if not PLOTS_ENABLED:
+            return
+        fig = fig or Figure()
+        scatter_stacked_df, corners_df, individuals, axes = PlotMixin._location_axes(
+            scatter_df, corners_df, fig
+        )
+        x = scatter_stacked_df[Coords.X.value].to_numpy(dtype=np.float64)
+        y = scatter_stacked_df[Coords.Y.value].to_numpy(dtype=np.float64)
+        hue = scatter_stacked_df[measure].to_numpy()
+        # Getting the shared bin edges (covering the locations and ROI corners)
+        xs = np.concatenate([x, corners_df[Coords.X.value].to_numpy(np.float64)])
+        ys = np.concatenate([y, corners_df[Coords.Y.value].to_numpy(np.float64)])
+        x_edges = np.linspace(np.nanmin(xs), np.nanmax(xs), bins + 1)
+        y_edges = np.linspace(np.nanmin(ys), np.nanmax(ys), bins + 1)
+        extent = (x_edges[0], x_edges[-1], y_edges[0], y_edges[-1])
+        # Getting the hue categories and their colours
+        categories = pd.unique(hue[pd.notna(hue)])
+        if categories.shape[0] > max_categories:
+            raise ValueError(
+                f'Invalid measure, "{measure}", for a location density plot.\n'
+                + f"It has {categories.shape[0]} categories, but the max is "
+                + f"{max_categories} (i.e. it must be categorical, not continuous)."
+            )
+        palette = sns.color_palette(n_colors=categories.shape[0])
+        valid = ~(np.isnan(x) | np.isnan(y))
+        for ax, indiv in zip(axes.flat, individuals):
+            is_indiv = valid & (scatter_stacked_df["individuals"] == indiv).to_numpy()
+            for category, colour in zip(categories, palette):
+                is_cat = is_indiv & (hue == category)
+                counts, _, _ = np.histogram2d(
+                    x[is_cat], y[is_cat], bins=(x_edges, y_edges)
+                )
+                # Making the RGBA image (opacity is log count, scaled to the max)
+                alpha = np.log1p(counts.T)
+                alpha /= alpha.max() if alpha.max() > 0 else 1
+                img = np.empty(alpha.shape + (4,), dtype=np.float64)
+                img[..., :3] = colour
+                img[..., 3] = alpha
+                ax.imshow(
+                    img,
+                    extent=extent,
+                    origin="lower",
+                    interpolation="nearest",
+                )
+                ax.plot([], [], color=colour, marker="s", ls="", label=str(category))
+            PlotMixin._roi_overlay(corners_df, ax)
+            ax.legend(title=measure)
+            ax.set_aspect("equal")
+            ax.set_title(indiv)
+        # Invert the y axis
+        axes.flat[0].invert_yaxis()
+        # Setting fig titles and labels
+        fig.subplots_adjust(top=0.85)
+        fig.suptitle("Spatial position", fontsize=12)
+        # Saving fig
+        PlotMixin._save_fig(fig, out_fp)
+
+    @staticmethod
+    def is_up_to_date(spec: PlotSpec) -> bool:
+        """
+        Returns whether the spec's plot PNG exists and is newer than its inputs.
+        """
+        if not os.path.isfile(spec.out_fp):
+            return False
+        out_mtime = os.path.getmtime(spec.out_fp)
+        in_fps = [i for i in (spec.data_fp, spec.corners_fp) if i is not None]
+        return all(os.path.getmtime(i) <= out_mtime for i in in_fps)
+
+    @staticmethod
+    def render(spec: PlotSpec, fig: None | Figure = None) -> None:
+        """
+        Renders the plot of the spec (reading its input dfs).
+        """
+        data_df = pd.read_feather(spec.data_fp)
+        if spec.kind == PlotKinds.BINNED.value:
+            PlotMixin.binned_plot(data_df, spec.out_fp, spec.column, fig)
+        elif spec.kind == PlotKinds.LOCATION.value:
+            assert spec.corners_fp, "Location plots need the ROI corners_fp."
+            corners_df = pd.read_feather(spec.corners_fp)
+            PlotMixin.location_plot(data_df, corners_df, spec.out_fp, spec.column, fig)
+        elif spec.kind == PlotKinds.LOCATION_DENSITY.value:
+            assert spec.corners_fp, "Location plots need the ROI corners_fp."
+            corners_df = pd.read_feather(spec.corners_fp)
+            PlotMixin.location_density_plot(
+                data_df, corners_df, spec.out_fp, spec.column, fig
+            )
+        else:
+            raise ValueError(
+                f'Invalid plot kind, "{spec.kind}".\n'
+                + f"Option must be one of: {[i.value for i in PlotKinds]}"
+            )
+
+    @staticmethod
+    def render_batch(specs: list[PlotSpec]) -> list[str]:
+        """
+        Renders the batch of plot specs, reusing one figure.
+        Returns the outcome string of each spec.
+        """
+        fig = Figure()
+        outcomes = []
+        for spec in specs:
+            try:
+                PlotMixin.render(spec, fig)
+                outcomes.append("")
+            except Exception as e:
+                fig.clf()
+                outcomes.append(f"ERROR: {spec.out_fp} failed to render.\n{e}\n")
+        return outcomes
+
+
+####################################################################################################
+# PLOT QUEUE CLASS
+####################################################################################################
+
+
+def _init_plot_worker() -> None:
+    """Initialises the plot worker process with a headless matplotlib backend."""
+    matplotlib.use("Agg")
+
+
+class PlotQueue:
+    """
+    Deferred plot rendering queue.
+
+    Compute steps `put` small plot specs (see `PlotSpec`), and `render` renders them
+    in batches on a pool of headless worker processes (each batch reusing a figure).
+    Plots whose PNG is newer than its inputs are skipped.
+    If `enabled` is False (default is `PLOTS_ENABLED`), specs are dropped.
+
+    Can be used as a context manager, rendering the queued plots on exit
+    (and raising a ValueError of the plots that failed to render), i.e.
+    ```
+    with PlotQueue() as plot_queue:
+        AnalyseBinnedDf.summary_binned(..., plot_queue=plot_queue)
+    ```
+    """
+
+    def __init__(
+        self,
+        enabled: bool = PLOTS_ENABLED,
+        max_workers: None | int = None,
+        batch_size: int = 16,
+    ):
+        self.enabled = enabled
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.specs: list[PlotSpec] = []
+
+    def put(self, spec: PlotSpec) -> None:
+        """Queues the plot spec."""
+        if self.enabled:
+            self.specs.append(spec)
+
+    def extend(self, specs: list[PlotSpec]) -> None:
+        """Queues the plot specs."""
+        for spec in specs:
+            self.put(spec)
+
+    def render(self) -> list[str]:
+        """
+        Renders the queued (and out of date) plots, and clears the queue.
+        Returns the outcome string of each queued plot (in the queue's order).
+        """
+        outcomes = [""] * len(self.specs)
+        ids = [
+            i for i, spec in enumerate(self.specs) if not PlotMixin.is_up_to_date(spec)
+        ]
+        specs = [self.specs[i] for i in ids]
+        self.specs = []
+        if not specs:
+            return outcomes
+        batches = [
+            specs[i : i + self.batch_size]
+            for i in range(0, len(specs), self.batch_size)
+        ]
+        with ProcessPoolExecutor(
+            max_workers=min(self.max_workers or os.cpu_count(), len(batches)),
+            mp_context=get_context("spawn"),
+            initializer=_init_plot_worker,
+        ) as executor:
+            outcomes_ls = executor.map(PlotMixin.render_batch, batches)
+            for i, outcome in zip(ids, (j for k in outcomes_ls for j in k)):
+                outcomes[i] = outcome
+        return outcomes
+
+    def __enter__(self) -> PlotQueue:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            errors = [i for i in self.render() if i.startswith("ERROR")]
+            if errors:
+                raise ValueError(
+                    f"{len(errors)} plots failed to render.\n" + "".join(errors)
+                )
@@ -5,9 +5,12 @@ Utility functions.
 from __future__ import annotations
 
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
 
 import cv2
-
+import numpy as np
 from behavysis_pipeline.mixins.subproc_mixin import SubprocMixin
 from behavysis_pipeline.pydantic_models.vid_metadata import VidMetadata
 
@@ -24,8 +27,59 @@ class ProcessVidMixin:
         fps: None | int = None,
         start_sec: None | float = None,
         stop_sec: None | float = None,
+        segments: int = 1,
+        max_workers: None | int = None,
     ) -> str:
-        """__summary__"""
+        """
+        Formats the video with ffmpeg (downsampling, changing fps, and trimming).
+
+        If `segments` is more than 1, the video is split (at keyframes) into
+        `segments` time ranges, which are encoded concurrently (in separate ffmpeg
+        processes, with up to `max_workers` at once) and then losslessly
+        concatenated.
+        """
+        if segments > 1:
+            return ProcessVidMixin.process_vid_segmented(
+                in_fp,
+                out_fp,
+                height_px,
+                width_px,
+                fps,
+                start_sec,
+                stop_sec,
+                segments,
+                max_workers,
+            )
+        cmd, outcome = ProcessVidMixin._process_vid_cmd(
+            in_fp, out_fp, height_px, width_px, fps, start_sec, stop_sec
+        )
+        # Making the output directory
+        os.makedirs(os.path.dirname(out_fp), exist_ok=True)
+        # Running ffmpeg command
+        # SubprocMixin.run_subproc_fstream(cmd)
+        SubprocMixin.run_subproc_console(cmd)
+        # Returning outcome
+        return outcome
+
+    @staticmethod
+    def _process_vid_cmd(
+        in_fp: str,
+        out_fp: str,
+        height_px: None | int = None,
+        width_px: None | int = None,
+        fps: None | int = None,
+        start_sec: None | float = None,
+        stop_sec: None | float = None,
+        n_frames: None | int = None,
+        keyframe_n: None | int = None,
+        threads: None | int = None,
+    ) -> tuple[list[str], str]:
+        """
+        Returns the ffmpeg command (and outcome string) to format the video.
+
+        `n_frames` limits the number of output frames, `keyframe_n` forces a
+        keyframe at this output frame, and `threads` limits the encoder threads.
+        """
         outcome = ""
         # Constructing ffmpeg command
         cmd = ["ffmpeg"]
@@ -65,6 +119,12 @@ class ProcessVidMixin:
             duration = stop_sec - (start_sec or 0)
             cmd += ["-t", str(duration)]
             outcome += f"Trimming video to {stop_sec} seconds.\n"
+        if keyframe_n:
+            cmd += ["-force_key_frames", f"expr:eq(n,{keyframe_n})"]
+        if n_frames:
+            cmd += ["-frames:v", str(n_frames)]
+        if threads:
+            cmd += ["-threads", str(threads)]
 
         # Adding output parameters to ffmpeg command
         cmd += [
@@ -79,14 +139,205 @@ class ProcessVidMixin:
             # "quiet",
             out_fp,
         ]
-        # Making the output directory
+        return cmd, outcome
+
+    @staticmethod
+    def process_vid_segmented(
+        in_fp: str,
+        out_fp: str,
+        height_px: None | int = None,
+        width_px: None | int = None,
+        fps: None | int = None,
+        start_sec: None | float = None,
+        stop_sec: None | float = None,
+        segments: int = 4,
+        max_workers: None | int = None,
+    ) -> str:
+        """
+        Formats the video (see `process_vid`) by encoding `segments` time ranges
+        concurrently, and losslessly concatenating them with the concat demuxer.
+
+        The ranges are split at the source keyframes nearest to equal time ranges
+        (snapped to source frames that are on the output frame grid), and each
+        range (but the last) is encoded with an exact number of frames, so the
+        output has the same frames as the non-segmented output.
+        If converting fps, each range is encoded with about a sec of extra
+        (warm-up) frames before it, which are cut when concatenating.
+        """
+        # Planning the segments
+        vid_metadata = ProcessVidMixin.get_vid_metadata(in_fp)
+        plan = ProcessVidMixin.get_segments(
+            vid_metadata.fps,
+            vid_metadata.total_frames,
+            ProcessVidMixin.get_keyframe_times(in_fp),
+            fps,
+            start_sec,
+            stop_sec,
+            segments,
+        )
+        out_fps = fps or vid_metadata.fps
+        # Making the output and parts directories
         os.makedirs(os.path.dirname(out_fp), exist_ok=True)
-        # Running ffmpeg command
-        # SubprocMixin.run_subproc_fstream(cmd)
-        SubprocMixin.run_subproc_console(cmd)
+        ext = os.path.splitext(out_fp)[1]
+        threads = max(1, (os.cpu_count() or 1) // len(plan))
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(out_fp)) as parts_dir:
+            # Constructing the ffmpeg command of each part
+            cmds = []
+            parts_fps = []
+            for i, part in enumerate(plan):
+                part_fp = os.path.join(parts_dir, f"part_{i:04d}{ext}")
+                cmd, _ = ProcessVidMixin._process_vid_cmd(
+                    in_fp,
+                    part_fp,
+                    height_px,
+                    width_px,
+                    fps,
+                    part["start_sec"],
+                    part["stop_sec"],
+                    n_frames=part["n_frames"],
+                    keyframe_n=part["keyframe_n"],
+                    threads=threads,
+                )
+                cmds.append(cmd)
+                parts_fps.append(part_fp)
+            # Running the ffmpeg commands concurrently
+            with ThreadPoolExecutor(max_workers=max_workers or len(cmds)) as executor:
+                list(executor.map(SubprocMixin.run_subproc_str, cmds))
+            # Concatenating the parts (without re-encoding), cutting the warm-up
+            # frames at the (forced) keyframe after them
+            entries = []
+            for part_fp, part in zip(parts_fps, plan):
+                entries.append(f"file '{part_fp}'\n")
+                if part["keyframe_n"] > 0:
+                    keyframes = ProcessVidMixin.get_keyframe_times(part_fp)
+                    min_sec = (part["keyframe_n"] - 0.5) / out_fps
+                    keyframe = keyframes[keyframes >= min_sec][0]
+                    inpoint = ProcessVidMixin._round_us(keyframe + 1e-6, True)
+                    entries.append(f"inpoint {inpoint}\n")
+            list_fp = os.path.join(parts_dir, "parts.txt")
+            with open(list_fp, "w", encoding="utf-8") as f:
+                f.writelines(entries)
+            cmd = ["ffmpeg", "-f", "concat", "-safe", "0", "-i", list_fp]
+            cmd += ["-c", "copy", "-y", out_fp]
+            SubprocMixin.run_subproc_str(cmd)
         # Returning outcome
+        _, outcome = ProcessVidMixin._process_vid_cmd(
+            in_fp, out_fp, height_px, width_px, fps, start_sec, stop_sec
+        )
+        outcome += f"Encoded in {len(cmds)} segments.\n"
         return outcome
 
+    @staticmethod
+    def get_segments(
+        in_fps: float,
+        total_frames: int,
+        keyframe_times: np.ndarray,
+        fps: None | int = None,
+        start_sec: None | float = None,
+        stop_sec: None | float = None,
+        segments: int = 4,
+    ) -> list[dict]:
+        """
+        Returns the parts of a `process_vid_segmented` encode of a video with the
+        given fps, number of frames, and keyframe times (secs).
+
+        Each part is a dict of its `start_sec` and `stop_sec` (the seek and trim
+        times, None if not trimmed), `n_frames` (the exact number of frames to
+        encode, None for the last part), and `keyframe_n` (the number of warm-up
+        frames, i.e. the frame index of the forced keyframe that is cut at).
+
+        The parts are split at the source keyframes nearest to equal time ranges
+        (snapped to source frames that are on the output frame grid).
+        """
+        # Getting the source frames range (the output starts at the first frame)
+        out_fps = fps or in_fps
+        first = int(np.ceil((start_sec or 0) * in_fps - 1e-6))
+        last = total_frames
+        if stop_sec:
+            last = min(last, int(np.ceil(stop_sec * in_fps - 1e-6)))
+        # Source frames that are also on the output frame grid (so the fps
+        # conversion of each range is the same) are every `period` frames
+        period = Fraction(out_fps / in_fps).limit_denominator(10000).denominator
+        # Getting the split points (as source frame numbers)
+        keyframes = np.round(np.asarray(keyframe_times) * in_fps)
+        keyframes = keyframes[(keyframes > first) & (keyframes < last)]
+        targets = np.linspace(first, last, segments + 1)[1:-1]
+        if keyframes.shape[0] > 0:
+            targets = keyframes[np.abs(keyframes - targets[:, None]).argmin(axis=1)]
+        splits = first + np.round((targets - first) / period).astype(np.int64) * period
+        splits = np.unique(splits[(splits > first) & (splits < last)])
+        src_starts = np.concatenate([[first], splits])
+        # Getting the output frame number of each split
+        out_starts = np.round((src_starts - first) * out_fps / in_fps).astype(np.int64)
+        # If converting fps, each part is started about a sec early (at a frame on
+        # the output frame grid), so the conversion (which drops/duplicates frames
+        # based on the preceding frames) is the same as in the non-segmented output.
+        # These warm-up frames are cut when concatenating.
+        warmups = np.zeros(src_starts.shape[0], dtype=np.int64)
+        if fps:
+            warmups = np.minimum(src_starts - first, np.ceil(in_fps / period) * period)
+            warmups = warmups.astype(np.int64)
+        out_warmups = np.round(warmups * out_fps / in_fps).astype(np.int64)
+        parts = []
+        for i in range(src_starts.shape[0]):
+            # Seeking to the (warm-up) start on the output frame grid
+            # (floored to microseconds)
+            offset_sec = (out_starts[i] - out_warmups[i]) / out_fps
+            part_start = start_sec
+            if i > 0:
+                part_start = (start_sec or 0) + offset_sec
+                part_start = ProcessVidMixin._round_us(part_start)
+            # Each part but the last has an exact number of frames,
+            # and the last is trimmed to the same stop
+            n_frames = None
+            part_stop = None
+            if i < src_starts.shape[0] - 1:
+                n_frames = int(out_warmups[i] + out_starts[i + 1] - out_starts[i])
+            elif stop_sec:
+                part_stop = stop_sec
+                if i > 0:
+                    part_stop = part_start + stop_sec - (start_sec or 0)
+                    part_stop -= offset_sec
+            parts.append(
+                {
+                    "start_sec": part_start,
+                    "stop_sec": part_stop,
+                    "n_frames": n_frames,
+                    "keyframe_n": int(out_warmups[i]),
+                }
+            )
+        return parts
+
+    @staticmethod
+    def _round_us(sec: float, up: bool = False) -> float:
+        """Rounds the seconds down (or up) to microseconds (ffmpeg's precision)."""
+        return float((np.ceil if up else np.floor)(sec * 1e6) / 1e6)
+
+    @staticmethod
+    def get_keyframe_times(fp: str) -> np.ndarray:
+        """
+        Returns the timestamps (in seconds) of the video's keyframes.
+        """
+        cmd = [
+            "ffprobe",
+            "-v",
+            "error",
+            "-select_streams",
+            "v:0",
+            "-skip_frame",
+            "nokey",
+            "-show_entries",
+            "frame=pts_time",
+            "-of",
+            "csv=p=0",
+            fp,
+        ]
+        out = SubprocMixin.run_subproc_str(cmd)
+        return np.array(
+            [float(i.strip(",")) for i in out.split() if i.strip(",")],
+            dtype=np.float64,
+        )
+
     @staticmethod
     def get_vid_metadata(fp: str) -> VidMetadata:
         """
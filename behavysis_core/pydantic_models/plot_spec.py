@@ -0,0 +1,25 @@
+"""
+_summary_
+"""
+
+from behavysis_pipeline.pydantic_models.pydantic_base_model import PydanticBaseModel
+from pydantic import ConfigDict
+
+
+class PlotSpec(PydanticBaseModel):
+    """
+    Spec of a deferred plot (rendered by `PlotQueue`).
+    """
+
+    model_config = ConfigDict(extra="forbid")
+
+    # PlotKinds value
+    kind: str
+    # Filepath of the plotted df
+    data_fp: str
+    # Filepath of the plot PNG
+    out_fp: str
+    # Plotted agg column (binned plots) or hue measure (location plots)
+    column: str
+    # Filepath of the ROI corners df (location plots)
+    corners_fp: None | str = None
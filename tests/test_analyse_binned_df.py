@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("behavysis_pipeline")
+
+from behavysis_pipeline.df_classes.analyse_binned_df import (  # noqa: E402
+    AnalyseBinnedDf,
+    BehavsAggregator,
+    QuantitativeAggregator,
+)
+
+# 10 frames at 2 fps (i.e. 0 to 4.5 sec)
+FPS = 2
+
+
+def make_df(data: dict) -> pd.DataFrame:
+    df = pd.DataFrame(data, index=pd.Index(np.arange(10), name="frame"))
+    df.columns.names = ["individuals", "measures"]
+    return df
+
+
+@pytest.fixture
+def quantitative_df() -> pd.DataFrame:
+    return make_df(
+        {
+            ("m0", "speed"): np.arange(1, 11, dtype=np.float64),
+            ("m0", "dist"): [0, 1, 0, 2, np.nan, 3, 0, 1, 4, 2],
+        }
+    )
+
+
+@pytest.fixture
+def behavs_df() -> pd.DataFrame:
+    return make_df({("m0", "fight"): [1, 1, 0, 1, 1, 1, 0, 0, 1, 1]})
+
+
+# Custom bins, with frames exactly on the lowest (0 sec, included in the first bin)
+# and upper (1.5 and 3 sec) bin edges, and a last bin up to the last frame
+BINS = [[1.5, 3], [0, 1.5, 3, 4.5], [2.2]]
+QUANTITATIVE_EXPECTED = [
+    {
+        ("m0", "speed", "mean"): [2.5, 6, 9],
+        ("m0", "speed", "min"): [1, 5, 8],
+        ("m0", "speed", "max"): [4, 7, 10],
+        ("m0", "speed", "Q1"): [1.75, 5.5, 8.5],
+        ("m0", "dist", "mean"): [0.75, 1.5, 7 / 3],
+        ("m0", "dist", "median"): [0.5, 1.5, 2],
+        ("m0", "dist", "std"): [0.829156, 1.5, 1.247219],
+    },
+    None,
+    {
+        ("m0", "speed", "mean"): [3, 8],
+        ("m0", "speed", "Q3"): [4, 9],
+        ("m0", "dist", "max"): [2, 4],
+        ("m0", "dist", "std"): [0.829156, 1.414214],
+    },
+]
+BEHAVS_EXPECTED = [
+    {
+        ("m0", "fight", "bout_freq"): [2, 1, 1],
+        ("m0", "fight", "bout_dur_total"): [1.5, 1, 1],
+        ("m0", "fight", "bout_dur_mean"): [0.75, 1, 1],
+        ("m0", "fight", "bout_dur_std"): [0.25, 0, 0],
+    },
+    None,
+    {
+        ("m0", "fight", "bout_freq"): [2, 2],
+        ("m0", "fight", "bout_dur_total"): [2, 1.5],
+        ("m0", "fight", "bout_dur_Q1"): [1, 0.625],
+    },
+]
+# The explicit bins (including 0 and the last frame) give the same bins
+QUANTITATIVE_EXPECTED[1] = QUANTITATIVE_EXPECTED[0]
+BEHAVS_EXPECTED[1] = BEHAVS_EXPECTED[0]
+
+
+def check_binned(binned_df: pd.DataFrame, bins: list, expected: dict) -> None:
+    bin_secs = sorted({*bins, 4.5})
+    bin_secs = bin_secs[1:] if bin_secs[0] == 0 else bin_secs
+    assert list(binned_df.index) == bin_secs
+    for column, values in expected.items():
+        np.testing.assert_allclose(binned_df[column].to_numpy(), values, rtol=1e-6)
+
+
+@pytest.mark.parametrize("bins, expected", list(zip(BINS, QUANTITATIVE_EXPECTED)))
+def test_make_binned_quantitative(quantitative_df, bins, expected):
+    binned_df = AnalyseBinnedDf.make_binned(
+        quantitative_df, FPS, bins, AnalyseBinnedDf.agg_quantitative
+    )
+    check_binned(binned_df, bins, expected)
+
+
+@pytest.mark.parametrize("bins, expected", list(zip(BINS, BEHAVS_EXPECTED)))
+def test_make_binned_behavs(behavs_df, bins, expected):
+    binned_df = AnalyseBinnedDf.make_binned(
+        behavs_df, FPS, bins, AnalyseBinnedDf.agg_behavs
+    )
+    check_binned(binned_df, bins, expected)
+
+
+def test_make_binned_multi(quantitative_df, behavs_df):
+    # All bins in one pass give the same binned dfs
+    for df, summary_func, expected_ls in [
+        (quantitative_df, AnalyseBinnedDf.agg_quantitative, QUANTITATIVE_EXPECTED),
+        (behavs_df, AnalyseBinnedDf.agg_behavs, BEHAVS_EXPECTED),
+    ]:
+        binned_df_ls = AnalyseBinnedDf.make_binned_multi(df, FPS, BINS, summary_func)
+        for binned_df, bins, expected in zip(binned_df_ls, BINS, expected_ls):
+            check_binned(binned_df, bins, expected)
+
+
+def test_behavs_aggregator_chunks():
+    # Bouts spanning chunk boundaries (including a bout over a whole chunk)
+    # are stitched, so chunked summaries equal the one-pass summary
+    df = make_df(
+        {
+            ("m0", "fight"): [1, 1, 1, 1, 0, 1, 0, 1, 1, 0],
+            ("m1", "fight"): [0, 1, 1, 1, 1, 1, 1, 0, 0, 1],
+        }
+    )
+    bounds = [0, 2, 3, 6, 8, 10]
+    chunks = [df.iloc[i:j] for i, j in zip(bounds[:-1], bounds[1:])]
+    summary_df = BehavsAggregator.from_chunks(chunks, FPS).to_df()
+    expected_df = AnalyseBinnedDf.agg_behavs(df, FPS)
+    pd.testing.assert_frame_equal(summary_df, expected_df[summary_df.columns])
+
+
+def test_quantitative_aggregator_merge():
+    # Merging the summaries of two experiments equals one pass over both
+    rng = np.random.default_rng(0)
+    df = make_df({("m0", "speed"): rng.normal(size=10), ("m0", "dist"): rng.random(10)})
+    df.iloc[3, 1] = np.nan
+    aggregator = QuantitativeAggregator.from_chunks([df.iloc[:4]], FPS)
+    aggregator.merge(QuantitativeAggregator.from_chunks([df.iloc[4:]], FPS))
+    expected_df = QuantitativeAggregator.from_chunks([df], FPS).to_df()
+    pd.testing.assert_frame_equal(aggregator.to_df(), expected_df)
+    # And the exact moments equal the one-pass summary func's
+    summary_df = AnalyseBinnedDf.agg_quantitative(df, FPS)
+    for agg in ["mean", "std", "min", "max"]:
+        np.testing.assert_allclose(aggregator.to_df()[agg], summary_df[agg])
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("behavysis_pipeline")
+
+from behavysis_pipeline.df_classes.behav_df import (  # noqa: E402
+    BehavCN,
+    BehavColumns,
+    BehavDf,
+)
+
+
+@pytest.fixture
+def behav_df() -> pd.DataFrame:
+    columns = pd.MultiIndex.from_product(
+        [["fight"], [i.value for i in BehavColumns]],
+        names=[i.value for i in BehavCN],
+    )
+    return pd.DataFrame(
+        [[0.1, 0, 0], [0.7, 1, 0], [0.95, 1, 1]],
+        index=pd.Index(np.arange(3), name=BehavDf.IN.FRAME.value),
+        columns=columns,
+    )
+
+
+@pytest.mark.parametrize("write", ["write_feather", "write_parquet", "write_h5"])
+def test_behav_df_roundtrip(behav_df, tmp_path, write):
+    fp = str(tmp_path / f"behav.{write.split('_')[1]}")
+    getattr(BehavDf, write)(behav_df, fp)
+    df = getattr(BehavDf, write.replace("write", "read"))(fp)
+    # Checking the prob outcome stays float and the others are int8
+    prob = df.loc[:, (slice(None), BehavColumns.PROB.value)]
+    np.testing.assert_allclose(prob.to_numpy().ravel(), [0.1, 0.7, 0.95], rtol=1e-6)
+    assert (prob.dtypes == np.float32).all()
+    assert (df.drop(columns=prob.columns).dtypes == np.int8).all()
+    assert (df.drop(columns=prob.columns).to_numpy() == [[0, 0], [1, 0], [1, 1]]).all()
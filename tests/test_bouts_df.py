@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("behavysis_pipeline")
+
+from behavysis_pipeline.df_classes.bouts_df import BoutsDf  # noqa: E402
+from behavysis_pipeline.pydantic_models.bouts import Bout, Bouts  # noqa: E402
+
+
+def test_bouts2frames_overlap():
+    # Overlapping bouts of the same behaviour (the last bout wins)
+    bouts = Bouts(
+        start=0,
+        stop=10,
+        bouts=[
+            Bout(start=2, stop=6, behaviour="f", actual=1, user_defined={"u": 1}),
+            Bout(start=5, stop=8, behaviour="f", actual=0, user_defined={"u": 0}),
+            Bout(start=1, stop=3, behaviour="g", actual=1, user_defined={}),
+        ],
+    )
+    df = BoutsDf.bouts2frames(bouts)
+    expected = {
+        ("f", "actual"): [0, 0, 1, 1, 1, 0, 0, 0, 0, 0],
+        ("f", "pred"): [0, 0, 1, 1, 1, 1, 1, 1, 1, 0],
+        ("f", "u"): [0, 0, 1, 1, 1, 0, 0, 0, 0, 0],
+        ("g", "actual"): [0, 1, 1, 1, 0, 0, 0, 0, 0, 0],
+        ("g", "pred"): [0, 1, 1, 1, 0, 0, 0, 0, 0, 0],
+    }
+    assert df.columns.tolist() == list(expected)
+    assert np.array_equal(df.to_numpy().T, list(expected.values()))
+    assert df.index.tolist() == list(range(10))
+
+
+def test_frames2bouts():
+    # Frames starting at 100, with ties in the modes (the smallest value wins)
+    # and user-defined outcomes
+    data = {
+        ("f", "actual"): [0, 1, 1, -1, -1, 0, 0, 1, 1, 1, 0, 0],
+        ("f", "pred"): [0, 1, 1, 1, 1, 0, 0, 1, 1, 1, 0, 1],
+        ("f", "u1"): [0, 0, 1, 1, 0, 0, 0, 2, 2, 1, 0, 1],
+        ("f", "u2"): [0, 1, 0, 0, 0, 0, 0, 0, 1, 1, 0, 0],
+        ("g", "actual"): [1, 1, 0, 0, 0, 0, 0, 0, 0, 1, -1, 0],
+        ("g", "pred"): [1, 1, 0, 0, 0, 0, 0, 0, 0, 1, 1, 0],
+    }
+    frames_df = pd.DataFrame(data, index=pd.Index(np.arange(100, 112), name="frame"))
+    frames_df.columns.names = ["behaviours", "outcomes"]
+    bouts = BoutsDf.frames2bouts(frames_df.astype(np.int8))
+    expected = Bouts(
+        start=100,
+        stop=112,
+        bouts=[
+            Bout(
+                start=101,
+                stop=104,
+                behaviour="f",
+                actual=-1,
+                user_defined={"u1": 0, "u2": 0},
+            ),
+            Bout(
+                start=107,
+                stop=109,
+                behaviour="f",
+                actual=1,
+                user_defined={"u1": 2, "u2": 1},
+            ),
+            Bout(
+                start=111,
+                stop=111,
+                behaviour="f",
+                actual=0,
+                user_defined={"u1": 1, "u2": 0},
+            ),
+            Bout(start=100, stop=101, behaviour="g", actual=1, user_defined={}),
+            Bout(start=109, stop=110, behaviour="g", actual=-1, user_defined={}),
+        ],
+    )
+    assert bouts.model_dump() == expected.model_dump()
@@ -0,0 +1,117 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+pytest.importorskip("behavysis_pipeline")
+
+from behavysis_pipeline.mixins.process_vid_mixin import ProcessVidMixin  # noqa: E402
+from behavysis_pipeline.mixins.subproc_mixin import SubprocMixin  # noqa: E402
+
+requires_ffmpeg = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None,
+    reason="ffmpeg and ffprobe are required.",
+)
+
+
+@pytest.mark.parametrize(
+    "fps, expected",
+    [
+        # Split at the keyframes nearest to 2.4, 4.8, 7.2, and 9.6 sec
+        (None, [(None, 60, 0), (2, 90, 0), (5, 60, 0), (7, 90, 0), (10, None, 0)]),
+        # Each part but the first starts a sec (15 output frames) early
+        (15, [(None, 30, 0), (1, 60, 15), (4, 45, 15), (6, 60, 15), (9, None, 15)]),
+    ],
+)
+def test_get_segments(fps, expected):
+    # 12 sec, 30 fps video with a keyframe every sec
+    parts = ProcessVidMixin.get_segments(30, 360, np.arange(12.0), fps, segments=5)
+    assert [(i["start_sec"], i["n_frames"], i["keyframe_n"]) for i in parts] == expected
+    assert all(i["stop_sec"] is None for i in parts)
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"fps": 15},
+        {"start_sec": 1.5, "stop_sec": 10.2},
+        {"fps": 25, "start_sec": 2, "stop_sec": 11},
+        {"fps": 60, "start_sec": 0.71, "stop_sec": 11.37},
+    ],
+)
+@pytest.mark.parametrize("segments", [2, 5])
+def test_get_segments_contiguous(kwargs, segments):
+    # 12 sec, 30 fps video with irregular keyframes
+    parts = ProcessVidMixin.get_segments(
+        30, 360, np.arange(0, 12, 1.1), segments=segments, **kwargs
+    )
+    out_fps = kwargs.get("fps", 30)
+    assert 1 < len(parts) <= segments
+    assert parts[0]["start_sec"] == kwargs.get("start_sec")
+    assert parts[0]["keyframe_n"] == 0
+    # Checking each part (after its warm-up frames) starts where the last one ends
+    stop = kwargs.get("start_sec", 0)
+    for part in parts[:-1]:
+        start = (part["start_sec"] or 0) + part["keyframe_n"] / out_fps
+        assert start == pytest.approx(stop, abs=1e-5)
+        stop = start + (part["n_frames"] - part["keyframe_n"]) / out_fps
+    # Checking the last part has no frames limit and is trimmed to the same stop
+    last = parts[-1]
+    assert last["start_sec"] + last["keyframe_n"] / out_fps == pytest.approx(
+        stop, abs=1e-5
+    )
+    assert last["n_frames"] is None
+    if "stop_sec" in kwargs:
+        assert last["stop_sec"] == pytest.approx(kwargs["stop_sec"], abs=1e-5)
+    else:
+        assert last["stop_sec"] is None
+
+
+def get_duration(fp: str) -> float:
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration"]
+    cmd += ["-of", "csv=p=0", fp]
+    return float(SubprocMixin.run_subproc_str(cmd).strip())
+
+
+@pytest.fixture(scope="module")
+def in_fp(tmp_path_factory):
+    # Making a 12 sec, 30 fps test video with a keyframe every sec
+    fp = str(tmp_path_factory.mktemp("vids") / "in.mp4")
+    cmd = ["ffmpeg", "-f", "lavfi", "-i", "testsrc=duration=12:size=320x240:rate=30"]
+    cmd += ["-c:v", "h264", "-g", "30", "-pix_fmt", "yuv420p", "-y", fp]
+    SubprocMixin.run_subproc_str(cmd)
+    return fp
+
+
+@requires_ffmpeg
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"width_px": 160, "fps": 15},
+        {"height_px": 120, "start_sec": 1.5, "stop_sec": 10.2},
+        {"fps": 25, "start_sec": 2, "stop_sec": 11},
+        {"fps": 60, "start_sec": 0.71, "stop_sec": 11.37},
+    ],
+)
+@pytest.mark.parametrize("segments", [2, 5])
+def test_process_vid_segmented(in_fp, tmp_path, kwargs, segments):
+    single_fp = str(tmp_path / "single.mp4")
+    segmented_fp = str(tmp_path / "segmented.mp4")
+    ProcessVidMixin.process_vid(in_fp, single_fp, **kwargs)
+    ProcessVidMixin.process_vid(in_fp, segmented_fp, segments=segments, **kwargs)
+    single_meta = ProcessVidMixin.get_vid_metadata(single_fp)
+    segmented_meta = ProcessVidMixin.get_vid_metadata(segmented_fp)
+    # Checking the frames and duration match the non-segmented output
+    assert os.path.isfile(segmented_fp)
+    assert segmented_meta.total_frames == single_meta.total_frames
+    assert segmented_meta.fps == pytest.approx(single_meta.fps)
+    assert (segmented_meta.width_px, segmented_meta.height_px) == (
+        single_meta.width_px,
+        single_meta.height_px,
+    )
+    assert get_duration(segmented_fp) == pytest.approx(
+        get_duration(single_fp), abs=1 / single_meta.fps
+    )